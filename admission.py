@@ -0,0 +1,127 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+import numpy as np
+
+
+# 一次回测中与选债数据同量级的中间结果份数（选债数据、排名列、过滤和排序的中间结果）
+FRAME_COPIES = 3
+
+
+class AdmissionRejected(Exception):
+    """队列已满，请求被拒绝"""
+
+    def __init__(self, retry_after, message):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """回测任务准入控制
+
+    按日期区间行数和选债范围估算每个任务的内存占用，同时运行的任务数和估算内存之和
+    都不超过上限；超出时按先来先到排队，排队数达到上限后直接拒绝，并按近期任务耗时给出重试等待时间。
+    """
+
+    def __init__(self, max_concurrency=2, memory_budget_mb=4096, max_queue=8):
+        """
+        Args:
+            max_concurrency: 同时运行的回测数上限
+            memory_budget_mb: 运行中任务的估算内存之和上限（MB）
+            max_queue: 排队等待的任务数上限
+        """
+        self.max_concurrency = max_concurrency
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.max_queue = max_queue
+
+        self._condition = asyncio.Condition()
+        self._waiting = deque()  # 排队中的任务凭据，按到达顺序
+        self._running = 0
+        self._memory_in_use = 0
+        self._bytes_per_row = None
+
+        self.admitted = 0
+        self.rejected = 0
+        self._wait_times = deque(maxlen=200)
+        self._run_times = deque(maxlen=200)
+
+    def estimate_memory(self, data_manager, start_date=None, end_date=None, universe=None):
+        """估算一次回测的内存占用（字节）：日期区间内（选债范围内）的行数 × 每行字节数 × 中间结果份数"""
+        if self._bytes_per_row is None:
+            self._bytes_per_row = data_manager.data.estimated_size() / max(data_manager.data.height, 1)
+
+        start_row, end_row = data_manager._date_row_range(start_date, end_date)
+        rows = end_row - start_row
+        if universe and rows > 0:
+            mask = np.unpackbits(data_manager._combine_universe(universe), count=data_manager.data.height)
+            rows = int(mask[start_row:end_row].sum())
+        return int(rows * self._bytes_per_row * FRAME_COPIES)
+
+    def _can_run(self, estimate):
+        return self._running < self.max_concurrency and self._memory_in_use + estimate <= self.memory_budget
+
+    def retry_after(self):
+        """建议的重试等待秒数：排在前面的任务按近期平均耗时分批完成所需的时间"""
+        average_run = sum(self._run_times) / len(self._run_times) if self._run_times else 10.0
+        batches = (len(self._waiting) + self._running) / max(self.max_concurrency, 1)
+        return max(1, int(average_run * batches + 0.5))
+
+    @asynccontextmanager
+    async def slot(self, estimate):
+        """
+        获取运行名额，用法: async with controller.slot(estimate): ...
+
+        Raises:
+            AdmissionRejected: 排队数已达上限
+        """
+        # 单个任务的估算超过总预算时按总预算计，保证它能在空闲时单独运行
+        estimate = min(estimate, self.memory_budget)
+        ticket = object()
+        arrived = time.time()
+
+        async with self._condition:
+            if not (not self._waiting and self._can_run(estimate)) and len(self._waiting) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected(self.retry_after(), f"回测队列已满（{len(self._waiting)} 个任务排队中）")
+            self._waiting.append(ticket)
+            try:
+                await self._condition.wait_for(lambda: self._waiting[0] is ticket and self._can_run(estimate))
+            except BaseException:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+                raise
+            self._waiting.popleft()
+            self._running += 1
+            self._memory_in_use += estimate
+            self.admitted += 1
+            self._wait_times.append(time.time() - arrived)
+            # 队首变化，后面的任务可能也可以运行
+            self._condition.notify_all()
+
+        started = time.time()
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._running -= 1
+                self._memory_in_use -= estimate
+                self._run_times.append(time.time() - started)
+                self._condition.notify_all()
+
+    def stats(self):
+        """队列和等待时间指标"""
+        waits = sorted(self._wait_times)
+        return {
+            "running": self._running,
+            "queue_depth": len(self._waiting),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "memory_in_use_mb": self._memory_in_use / 1024 / 1024,
+            "memory_budget_mb": self.memory_budget / 1024 / 1024,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_seconds": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait_seconds": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "avg_run_seconds": sum(self._run_times) / len(self._run_times) if self._run_times else 0.0,
+        }
@@ -1,54 +1,184 @@
 import os
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib.pyplot as plt
+from attribution import PerformanceAttribution
 
-def generate_backtest_reports(strategy, output_dir):
+
+def export_trade_records(strategy, output_dir):
+    """导出交易记录CSV，无交易时返回None"""
+    trade_records = strategy.get_trade_records()
+    if trade_records.empty:
+        return None
+    trade_file = os.path.join(output_dir, 'trade_records.csv')
+    trade_records.to_csv(trade_file, index=False, encoding='utf-8-sig')
+    print(f"交易记录已保存至: {trade_file}")
+    return trade_file
+
+
+def export_daily_report(strategy, output_dir):
+    """导出每日持仓报告CSV，无数据时返回None"""
+    report = strategy.get_daily_report()
+    if report.empty:
+        return None
+    report_file = os.path.join(output_dir, 'daily_report.csv')
+    report.to_csv(report_file, index=False, encoding='utf-8-sig')
+    print(f"每日持仓报告已保存至: {report_file}")
+    return report_file
+
+
+def render_performance_chart(strategy, output_dir, dpi=300):
+    """绘制净值曲线并保存为PNG"""
+    plt.figure(figsize=(12, 6))
+    strategy.plot_performance()
+    plt.title(f"{strategy.strategy_name} 净值曲线")
+    plt.tight_layout()
+    performance_file = os.path.join(output_dir, 'performance.png')
+    plt.savefig(performance_file, dpi=dpi)
+    plt.close('all')
+    return performance_file
+
+
+# 报告产物名称 -> 生成函数
+REPORT_ARTIFACTS = {
+    'trade_records': export_trade_records,
+    'daily_report': export_daily_report,
+    'performance_chart': render_performance_chart,
+}
+
+
+def generate_backtest_reports(strategy, output_dir, include_chart=True):
     """
     生成回测后的各种报告和图表
-    
+
     参数:
         strategy: 回测策略对象
         output_dir: 输出目录路径
-    
+        include_chart: 是否绘制净值曲线PNG
+
     返回:
         dict: 包含各种报告路径的字典
     """
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
-    
+
     report_files = {}
-    
+
     # 分析结果
     results = strategy.analyze_results()
     print("\n回测结果:")
     for key, value in results.items():
         print(f"{key}: {value}")
-    
+
     # 导出交易记录
-    trade_records = strategy.get_trade_records()
-    if not trade_records.empty:
-        trade_file = os.path.join(output_dir, 'trade_records.csv')
-        trade_records.to_csv(trade_file, index=False, encoding='utf-8-sig')
-        print(f"交易记录已保存至: {trade_file}")
+    trade_file = export_trade_records(strategy, output_dir)
+    if trade_file:
         report_files['trade_records'] = trade_file
-    
+
     # 绘制净值曲线
-    plt.figure(figsize=(12, 6))
-    strategy.plot_performance()
-    plt.title(f"{strategy.strategy_name} 净值曲线")
-    plt.tight_layout()
-    performance_file = os.path.join(output_dir, 'performance.png')
-    plt.savefig(performance_file, dpi=300)
-    plt.close()
-    report_files['performance_chart'] = performance_file
+    if include_chart:
+        report_files['performance_chart'] = render_performance_chart(strategy, output_dir)
 
-    
     # 输出策略持仓报告
-    report = strategy.get_daily_report()
-    if not report.empty:
-        report_file = os.path.join(output_dir, 'daily_report.csv')
-        report.to_csv(report_file, index=False, encoding='utf-8-sig')
-        print(f"每日持仓报告已保存至: {report_file}")
+    report_file = export_daily_report(strategy, output_dir)
+    if report_file:
         report_files['daily_report'] = report_file
-    
+
     print("\n回测报告生成完成!")
-    return report_files 
\ No newline at end of file
+    return report_files
+
+
+class BacktestResultStore:
+    """回测结果仓库
+
+    按结果ID保存已完成的策略对象，报告产物在首次请求时由后台线程生成并缓存，
+    不占用回测请求本身的耗时。只保留最近的 max_results 个结果。
+    """
+
+    def __init__(self, max_results=32, chart_dpi=150):
+        self.max_results = max_results
+        self.chart_dpi = chart_dpi
+        self._results = OrderedDict()  # {result_id: {"strategy", "output_dir", "artifacts", "attribution"}}
+        self._lock = threading.Lock()
+        # matplotlib的pyplot不是线程安全的，所有产物都在同一个后台线程中串行生成
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="report")
+
+    def add(self, strategy, output_dir):
+        """登记一个已完成的回测，返回结果ID"""
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._results[result_id] = {
+                "strategy": strategy,
+                "output_dir": output_dir,
+                "artifacts": {},  # {产物名称: Future}
+            }
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+        return result_id
+
+    def get_strategy(self, result_id):
+        """获取结果ID对应的策略对象，不存在时返回None"""
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is None:
+                return None
+            self._results.move_to_end(result_id)
+            return entry["strategy"]
+
+    def get_attribution(self, result_id, data_manager):
+        """获取结果的收益归因，首次请求时计算并缓存
+
+        Raises:
+            KeyError: 结果ID不存在
+        """
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is None:
+                raise KeyError(result_id)
+            self._results.move_to_end(result_id)
+            attribution = entry.get("attribution")
+        if attribution is not None:
+            return attribution
+
+        attribution = PerformanceAttribution(entry["strategy"], data_manager)
+        with self._lock:
+            entry.setdefault("attribution", attribution)
+            return entry["attribution"]
+
+    def request_artifact(self, result_id, artifact):
+        """请求生成报告产物
+
+        同一结果的同一产物只生成一次，重复请求返回同一个Future。
+
+        Returns:
+            concurrent.futures.Future: 结果为产物文件路径（无数据时为None）
+
+        Raises:
+            KeyError: 结果ID不存在
+            ValueError: 产物名称无效
+        """
+        if artifact not in REPORT_ARTIFACTS:
+            raise ValueError(f"无效的报告类型: {artifact}。有效选项: {list(REPORT_ARTIFACTS)}")
+
+        with self._lock:
+            entry = self._results.get(result_id)
+            if entry is None:
+                raise KeyError(result_id)
+            self._results.move_to_end(result_id)
+
+            future = entry["artifacts"].get(artifact)
+            if future is None:
+                future = self._executor.submit(
+                    self._generate_artifact, entry["strategy"], entry["output_dir"], artifact
+                )
+                entry["artifacts"][artifact] = future
+            return future
+
+    def _generate_artifact(self, strategy, output_dir, artifact):
+        """在后台线程中生成单个报告产物"""
+        os.makedirs(output_dir, exist_ok=True)
+        if artifact == 'performance_chart':
+            return render_performance_chart(strategy, output_dir, dpi=self.chart_dpi)
+        return REPORT_ARTIFACTS[artifact](strategy, output_dir)
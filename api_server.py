@@ -1,16 +1,35 @@
-from fastapi import FastAPI, WebSocket, HTTPException, Query
+import matplotlib
+# 服务端没有图形界面，且图表在后台线程中生成，使用非交互式后端
+matplotlib.use('Agg')
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse
 from typing import Dict, List, Optional, Union, Any
 from datetime import datetime, date
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 import signal
 import sys
 import time
 from create_strategy import create_strategy
 from data_manager import DataManager
-from after_backtest_report import generate_backtest_reports
+from after_backtest_report import generate_backtest_reports, BacktestResultStore
+from compare_strategies import run_strategy_comparison
+from factor_analysis import FactorAnalyzer
+from robustness import block_bootstrap
+from trade_analytics import analyze_trades
+from screener import BondScreener
+from http_cache import HttpCacheMiddleware, ResponseCache, dataset_version, latest_trading_date
+from single_flight import SingleFlight
+from admission import AdmissionController, AdmissionRejected
+from broadcast_hub import BroadcastHub
+from market_stream import MarketReplay
+from generate_factor_configs import FactorConfigGenerator
 import polars as pl
+import asyncio
+import hashlib
+import json
 import os
 
 # 全局数据预加载
@@ -19,6 +38,34 @@ load_start_time = time.time()
 global_data_manager = DataManager('data/cb_data.pq')
 print(f"数据加载完成, 耗时: {time.time() - load_start_time:.2f}秒")
 
+# 回测结果仓库，报告产物按需在后台生成并缓存
+result_store = BacktestResultStore()
+
+# 因子分析器（首次请求时创建，未来收益率只计算一次）
+factor_analyzer: Optional[FactorAnalyzer] = None
+
+# 转债筛选器，缓存最近的筛选结果
+screener = BondScreener(global_data_manager)
+
+# 合并并发的相同请求：回测和市场统计各一组
+backtest_flight = SingleFlight("backtest")
+market_flight = SingleFlight("market")
+
+# 回测准入控制：并发数、估算内存预算和排队上限可通过环境变量配置
+admission = AdmissionController(
+    max_concurrency=int(os.environ.get("BACKTEST_MAX_CONCURRENCY", 2)),
+    memory_budget_mb=int(os.environ.get("BACKTEST_MEMORY_BUDGET_MB", 4096)),
+    max_queue=int(os.environ.get("BACKTEST_MAX_QUEUE", 8)),
+)
+
+# WebSocket广播中心：按主题推送任务进度、数据更新和行情增量
+hub = BroadcastHub(max_queue=int(os.environ.get("WS_MAX_QUEUE", 256)))
+
+# 行情增量推送：用历史数据按交易日回放
+market_replay = MarketReplay(
+    global_data_manager, hub, keyframe_every=int(os.environ.get("MARKET_STREAM_KEYFRAME_EVERY", 60))
+)
+
 # 数据模型定义
 class ConvertibleBond(BaseModel):
     code: str
@@ -73,6 +120,9 @@ class RankingData(BaseModel):
     top_losers: List[ConvertibleBond]  # 涨幅最小的
     most_active: List[ConvertibleBond]  # 成交额最高的
 
+# 单次回测允许的块自助法重抽样次数上限（在共享线程池中计算）
+MAX_BOOTSTRAP_RESAMPLES = 20000
+
 # 回测参数模型
 class BacktestParams(BaseModel):
     initial_capital: Optional[float] = 1000000.0
@@ -81,10 +131,77 @@ class BacktestParams(BaseModel):
     end_date: Optional[str] = None
     strategy_params: Optional[Dict] = {}
     output_dir: Optional[str] = None
+    generate_chart: Optional[bool] = False  # 是否在后台预先生成净值曲线PNG
+    bootstrap_resamples: int = Field(2000, ge=0, le=MAX_BOOTSTRAP_RESAMPLES)  # 块自助法重抽样次数，为0时不计算置信区间
+    rebalance_mode: Optional[str] = "full"  # full: 每日全量再平衡；incremental: 只交易进出TOPN的转债
+    drift_tolerance: Optional[float] = Field(None, ge=0)  # 增量模式下留存持仓的偏离容忍带
+    rebalance_schedule: Optional[Union[str, Dict[str, int], List[str]]] = "daily"  # daily / weekly / monthly / {"every_n": N} / 日期列表
+
+# 多策略对比中的单个策略配置
+class CompareStrategyConfig(BaseModel):
+    name: Optional[str] = None
+    initial_capital: Optional[float] = None
+    top_n: Optional[int] = None
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    strategy_params: Optional[Dict] = {}
+
+# 多策略对比参数模型，未在单个策略中指定的字段使用这里的公共值
+class CompareParams(BaseModel):
+    configs: List[CompareStrategyConfig]
+    initial_capital: Optional[float] = 1000000.0
+    top_n: Optional[int] = 10
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    max_workers: Optional[int] = 4
+
+# 筛选器排序键
+class ScreenerSortKey(BaseModel):
+    column: str
+    descending: Optional[bool] = False
+
+# 筛选器查询参数
+class ScreenerParams(BaseModel):
+    date: Optional[str] = None  # 交易日，默认最新交易日
+    filters: Optional[Union[Dict, List]] = None  # 过滤规则，格式同 strategy_params.filters
+    sort: Optional[List[ScreenerSortKey]] = []
+    columns: Optional[List[str]] = None  # 返回的列，默认全部列
+    page: int = Field(1, ge=1)
+    page_size: int = Field(50, ge=1, le=1000)
+
+# 行情回放参数
+class MarketStreamParams(BaseModel):
+    start_date: Optional[str] = None  # 默认第一个交易日
+    end_date: Optional[str] = None  # 默认最后一个交易日
+    interval: float = Field(1.0, gt=0)  # 每个交易日间隔的秒数
+    loop: bool = False  # 回放结束后是否从头循环
 
 app = FastAPI()
 
-# 配置CORS - 兼容所有环境
+# 市场数据接口的HTTP缓存：内容ETag + 304 + Cache-Control，响应体按数据集版本和请求缓存
+http_cache = ResponseCache(max_entries=256)
+app.add_middleware(
+    HttpCacheMiddleware,
+    paths=[
+        "/api/convertible-bonds",
+        "/api/market-overview",
+        "/api/distribution-data",
+        "/api/ranking-data",
+        "/api/trading-dates",
+    ],
+    get_version=lambda: dataset_version(global_data_manager, load_start_time),
+    get_latest_date=lambda: latest_trading_date(global_data_manager),
+    cache=http_cache,
+)
+
+# 压缩较大的JSON响应，安装了 brotli-asgi 时优先使用brotli（客户端不支持时回退gzip）
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=1024, gzip_fallback=True)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+# 配置CORS - 兼容所有环境（最外层，304等缓存响应同样带上跨域头）
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # 允许所有域名，简化配置
@@ -93,9 +210,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 存储WebSocket连接
-active_connections: Dict[int, WebSocket] = {}
-
 def signal_handler(sig, frame):
     print("\n优雅关闭服务器...")
     sys.exit(0)
@@ -184,6 +298,86 @@ async def get_convertible_bonds(date: Optional[str] = None):
         error_detail = traceback.format_exc()
         raise HTTPException(status_code=500, detail=f"获取可转债数据失败: {str(e)}\n{error_detail}")
 
+# 单只转债历史默认返回的列
+DEFAULT_HISTORY_COLUMNS = ["close", "pct_chg", "conv_prem", "ytm", "dblow"]
+
+@app.get("/api/convertible-bonds/{code}/history")
+async def get_bond_history(
+    code: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    columns: Optional[str] = Query(None, description="逗号分隔的列名，默认 close,pct_chg,conv_prem,ytm,dblow")
+):
+    """获取单只转债的历史序列（按列返回，便于前端绘图）"""
+    data_manager = global_data_manager
+    available_columns = set(data_manager.data.columns)
+    if columns:
+        column_list = [c.strip() for c in columns.split(",") if c.strip()]
+        missing = [c for c in column_list if c not in available_columns]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"数据中不存在的列: {missing}")
+    else:
+        column_list = [c for c in DEFAULT_HISTORY_COLUMNS if c in available_columns]
+    
+    try:
+        history = data_manager.get_bond_history(code, start_date, end_date, column_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"找不到转债: {code}")
+    
+    history = history.with_columns([
+        pl.col(pl.Float32, pl.Float64).fill_nan(None),
+        pl.col(data_manager.date_column).dt.strftime("%Y-%m-%d"),
+    ])
+    return {
+        "status": "success",
+        "data": {
+            "code": code,
+            "dates": history.get_column(data_manager.date_column).to_list(),
+            "series": {col: history.get_column(col).to_list() for col in column_list if col != data_manager.date_column},
+        }
+    }
+
+@app.post("/api/screener")
+async def screen_bonds(params: ScreenerParams):
+    """按过滤规则、排序键和列投影筛选某个交易日的转债，分页返回"""
+    try:
+        result = await asyncio.to_thread(
+            screener.screen,
+            params.date,
+            params.filters,
+            [key.dict() for key in params.sort or []],
+            params.columns,
+            params.page,
+            params.page_size,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"筛选失败: {str(e)}")
+    return {"status": "success", "data": result}
+
+@app.post("/api/market-stream/start")
+async def start_market_stream(params: MarketStreamParams):
+    """开始回放历史行情，通过WebSocket的 market_delta 主题推送关键帧和增量帧"""
+    try:
+        market_replay.start(params.start_date, params.end_date, params.interval, params.loop)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "data": market_replay.stats()}
+
+@app.post("/api/market-stream/stop")
+async def stop_market_stream():
+    """停止行情回放"""
+    market_replay.stop()
+    return {"status": "success", "data": market_replay.stats()}
+
+@app.get("/api/market-stream/status")
+async def get_market_stream_status():
+    """行情回放状态"""
+    return {"status": "success", "data": market_replay.stats()}
+
 @app.get("/api/field-info")
 async def get_field_info():
     """获取字段信息"""
@@ -203,7 +397,52 @@ async def get_field_info():
 
 @app.post("/api/backtest")
 async def run_backtest(strategy_type: StrategyType, params: BacktestParams):
-    """运行回测策略并返回结果"""
+    """运行回测策略并返回结果
+    
+    参数相同的并发请求合并为一次回测，共享同一份结果
+    """
+    key = SingleFlight.make_key(strategy_type.value, params.dict())
+    job_id = hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+    try:
+        return await backtest_flight.do(key, lambda: _admitted_backtest(job_id, strategy_type, params))
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def _admitted_backtest(job_id: str, strategy_type: StrategyType, params: BacktestParams):
+    """按估算内存获取准入名额后在工作线程中运行回测，并在 job_progress 主题推送任务状态"""
+    def progress(status, **extra):
+        hub.publish("job_progress", {"job_id": job_id, "strategy_type": strategy_type.value, "status": status, **extra},
+                    coalesce_key=job_id)
+
+    # 日期格式无效或选债范围未定义时估算会抛出ValueError；首次使用某个选债范围时需要计算掩码，放到线程中执行
+    try:
+        estimate = await asyncio.to_thread(
+            admission.estimate_memory,
+            global_data_manager, params.start_date, params.end_date, (params.strategy_params or {}).get("universe")
+        )
+    except ValueError as e:
+        progress("failed", error=str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    progress("queued")
+    try:
+        async with admission.slot(estimate):
+            progress("running")
+            result = await asyncio.to_thread(_run_backtest_job, strategy_type, params)
+    except AdmissionRejected as e:
+        progress("rejected", retry_after=e.retry_after)
+        raise
+    except Exception as e:
+        progress("failed", error=str(getattr(e, "detail", e)))
+        raise
+    # _run_backtest_job 把回测中的异常作为 {"error": ...} 返回
+    if "error" in result:
+        progress("failed", error=result["error"])
+    else:
+        progress("completed", result_id=result.get("result_id"))
+    return result
+
+def _run_backtest_job(strategy_type: StrategyType, params: BacktestParams):
+    """运行回测并构建结果字典（在工作线程中执行）"""
     start_time = time.time()  # 记录开始时间
     
     try:
@@ -214,7 +453,10 @@ async def run_backtest(strategy_type: StrategyType, params: BacktestParams):
             "top_n": params.top_n,
             "start_date": params.start_date,
             "end_date": params.end_date,
-            "strategy_params": params.strategy_params
+            "strategy_params": params.strategy_params,
+            "rebalance_mode": params.rebalance_mode,
+            "drift_tolerance": params.drift_tolerance,
+            "rebalance_schedule": params.rebalance_schedule
         }
         
         # 设置输出目录
@@ -232,13 +474,22 @@ async def run_backtest(strategy_type: StrategyType, params: BacktestParams):
         # 运行回测，传入config参数
         strategy.run_backtest(data_manager, config=config)
         
-        # 生成回测报告和图表
-        report_files = generate_backtest_reports(strategy, config["output_dir"])
+        # 登记回测结果，报告产物改为按需生成，不在请求路径中渲染图表和写CSV
+        result_id = result_store.add(strategy, config["output_dir"])
+        if params.generate_chart:
+            result_store.request_artifact(result_id, 'performance_chart')
+        report_files = {
+            artifact: f"/api/results/{result_id}/reports/{artifact}"
+            for artifact in ('trade_records', 'daily_report', 'performance_chart')
+        }
         
         # 构建最小化处理的结果字典
         # 直接返回原始数据格式，让前端来适应
         result = {
+            "result_id": result_id,
             "performance": strategy.analyze_results(),
+            "robustness": block_bootstrap(strategy.portfolio_values, n_resamples=params.bootstrap_resamples) if params.bootstrap_resamples else None,
+            "trade_analytics": analyze_trades(strategy)["summary"],
             "trades": strategy.get_trade_records().to_dict(orient='records'),
             "daily": strategy.get_daily_report().to_dict(orient='records'),
             "report_files": report_files,
@@ -275,8 +526,108 @@ async def run_backtest(strategy_type: StrategyType, params: BacktestParams):
         import traceback
         return {"error": str(e), "traceback": traceback.format_exc()}
 
+# 注意：需在 /api/backtest/{strategy_name} 之前注册，否则会被其匹配
+@app.post("/api/backtest/compare")
+async def run_backtest_compare(params: CompareParams):
+    """并行运行多个策略并返回对齐的净值序列和对比表
+    
+    选债范围相同的策略共享过滤和排名计算
+    """
+    if not params.configs:
+        raise HTTPException(status_code=400, detail="至少需要提供一个策略配置")
+    
+    batch_id = int(time.time())
+    configs = []
+    for i, item in enumerate(params.configs):
+        name = item.name or f"策略{i + 1}"
+        configs.append({
+            "strategy_type": StrategyType.CUSTOM.value,
+            "name": name,
+            "initial_capital": item.initial_capital if item.initial_capital is not None else params.initial_capital,
+            "top_n": item.top_n if item.top_n is not None else params.top_n,
+            "start_date": item.start_date or params.start_date,
+            "end_date": item.end_date or params.end_date,
+            "strategy_params": item.strategy_params or {},
+            "output_dir": f"results/compare_{batch_id}/{i}",
+        })
+    
+    try:
+        # 多个策略同时运行，按各自估算内存之和申请准入
+        estimate = sum(await asyncio.gather(*(
+            asyncio.to_thread(
+                admission.estimate_memory,
+                global_data_manager, config["start_date"], config["end_date"], config["strategy_params"].get("universe")
+            )
+            for config in configs
+        )))
+        async with admission.slot(estimate):
+            # 在线程中运行，避免阻塞事件循环
+            return await asyncio.to_thread(
+                run_strategy_comparison, global_data_manager, configs, params.max_workers
+            )
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        import traceback
+        return {"error": str(e), "traceback": traceback.format_exc()}
+
+@app.get("/api/results/{result_id}/attribution")
+async def get_backtest_attribution(
+    result_id: str,
+    view: str = "bonds",
+    page: int = 1,
+    page_size: int = Query(50, ge=1, le=1000),
+    code: Optional[str] = None,
+    industry: Optional[str] = None
+):
+    """回测收益归因（分页）
+    
+    view: bonds（转债累计贡献）、bond_daily（转债每日贡献）、industries（行业累计贡献）、industry_daily（行业每日贡献）
+    归因在首次请求时计算并随回测结果缓存
+    """
+    try:
+        attribution = await asyncio.to_thread(result_store.get_attribution, result_id, global_data_manager)
+        data = attribution.page(view=view, page=page, page_size=page_size, code=code, industry=industry)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"回测结果不存在或已过期: {result_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"收益归因失败: {str(e)}")
+    
+    data["view"] = view
+    data["summary"] = attribution.summary()
+    return {"status": "success", "data": data}
+
+@app.get("/api/results/{result_id}/reports/{artifact}")
+async def get_backtest_report(result_id: str, artifact: str):
+    """按需获取回测报告产物（trade_records / daily_report / performance_chart）
+    
+    首次请求时在后台线程生成，之后直接返回缓存的文件
+    """
+    try:
+        future = result_store.request_artifact(result_id, artifact)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"回测结果不存在或已过期: {result_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        report_file = await asyncio.wrap_future(future)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"生成报告失败: {str(e)}")
+    
+    if not report_file:
+        raise HTTPException(status_code=404, detail=f"回测结果中没有可导出的数据: {artifact}")
+    return FileResponse(report_file, filename=os.path.basename(report_file))
+
 @app.get("/api/market-overview", response_model=MarketOverview)
 async def get_market_overview(date: Optional[str] = None):
+    """获取市场总览数据（相同参数的并发请求合并为一次计算）"""
+    key = SingleFlight.make_key("/api/market-overview", date)
+    return await market_flight.do(key, lambda: asyncio.to_thread(_compute_market_overview, date))
+
+def _compute_market_overview(date: Optional[str] = None):
     """获取市场总览数据"""
     try:
         # 获取数据管理器
@@ -349,6 +700,11 @@ async def get_market_overview(date: Optional[str] = None):
 
 @app.get("/api/distribution-data", response_model=DistributionData)
 async def get_distribution_data(date: Optional[str] = None):
+    """获取分布统计数据（相同参数的并发请求合并为一次计算）"""
+    key = SingleFlight.make_key("/api/distribution-data", date)
+    return await market_flight.do(key, lambda: asyncio.to_thread(_compute_distribution_data, date))
+
+def _compute_distribution_data(date: Optional[str] = None):
     """获取分布统计数据"""
     try:
         # 获取数据管理器
@@ -493,25 +849,60 @@ async def get_distribution_data(date: Optional[str] = None):
         raise HTTPException(status_code=500, detail=f"获取分布统计数据失败: {str(e)}")
 
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: int):
-    """WebSocket连接处理"""
+async def websocket_endpoint(websocket: WebSocket, client_id: int, topics: Optional[str] = None):
+    """WebSocket连接处理
+
+    连接时可用查询参数 topics=job_progress,market_delta 订阅主题，连接后也可以发送
+    {"action": "subscribe" | "unsubscribe", "topics": [...]} 修改订阅。
+    推送消息格式为 {"topic": 主题, "seq": 序号, "data": 内容}；其他消息按原方式回复确认。
+    订阅 market_delta 时先收到当前关键帧，之后发送 {"action": "snapshot"} 可重新获取关键帧。
+    """
     await websocket.accept()
-    active_connections[client_id] = websocket
+    connection = hub.connect(client_id, websocket)
+    if topics:
+        hub.subscribe(connection, [topic.strip() for topic in topics.split(",") if topic.strip()])
+        if "market_delta" in connection.topics:
+            market_replay.send_snapshot(connection)
     try:
         while True:
             data = await websocket.receive_text()
-            # 处理接收到的数据
-            response_data = {
-                "message": "数据已接收", 
-                "timestamp": str(datetime.now())
-            }
-            await websocket.send_json(response_data)
-    except:
-        if client_id in active_connections:
-            del active_connections[client_id]
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+
+            if isinstance(message, dict) and message.get("action") in ("subscribe", "unsubscribe"):
+                requested = message.get("topics") or []
+                if isinstance(requested, str):
+                    requested = [requested]
+                if message["action"] == "subscribe":
+                    invalid = hub.subscribe(connection, requested)
+                else:
+                    hub.unsubscribe(connection, requested)
+                    invalid = []
+                hub.send(connection, {"type": "subscription", "topics": sorted(connection.topics), "invalid": invalid})
+                if message["action"] == "subscribe" and "market_delta" in requested:
+                    market_replay.send_snapshot(connection)
+            elif isinstance(message, dict) and message.get("action") == "snapshot":
+                market_replay.send_snapshot(connection)
+            else:
+                # 处理接收到的数据
+                hub.send(connection, {
+                    "message": "数据已接收",
+                    "timestamp": str(datetime.now())
+                })
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.disconnect(connection)
 
 @app.get("/api/ranking-data", response_model=RankingData)
 async def get_ranking_data(date: Optional[str] = None, limit: int = 10):
+    """获取排行榜数据（相同参数的并发请求合并为一次计算）"""
+    key = SingleFlight.make_key("/api/ranking-data", date, limit)
+    return await market_flight.do(key, lambda: asyncio.to_thread(_compute_ranking_data, date, limit))
+
+def _compute_ranking_data(date: Optional[str] = None, limit: int = 10):
     """获取排行榜数据"""
     try:
         # 获取数据管理器
@@ -735,6 +1126,68 @@ async def get_available_factors():
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取因子列表失败: {str(e)}")
 
+@app.get("/api/factor-analysis")
+async def get_factor_analysis(
+    factors: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    universe: Optional[str] = None,
+    quantiles: int = 5
+):
+    """批量因子分析：Rank IC、IC IR、分位收益和换手率（无需运行回测）
+    
+    factors为逗号分隔的因子列表，默认分析因子库中全部可用因子；universe为预定义的选债范围名称
+    """
+    global factor_analyzer
+    try:
+        data_manager = global_data_manager
+        if factors:
+            factor_list = [f.strip() for f in factors.split(",") if f.strip()]
+            # 时间序列特征（如 ret_20d）按需计算后即可参与分析
+            await asyncio.to_thread(data_manager.ensure_features, factor_list)
+            available_columns = set(data_manager.data.columns) | set(data_manager.feature_data.columns)
+            missing = [f for f in factor_list if f not in available_columns]
+            if missing:
+                raise HTTPException(status_code=400, detail=f"数据中不存在的因子: {missing}")
+        else:
+            available_columns = set(data_manager.data.columns)
+            factor_list = [f for f in FactorConfigGenerator().all_factors if f in available_columns]
+        
+        if factor_analyzer is None:
+            factor_analyzer = await asyncio.to_thread(FactorAnalyzer, data_manager)
+        
+        results = await asyncio.to_thread(
+            factor_analyzer.analyze, factor_list, start_date, end_date, universe, quantiles
+        )
+        return {
+            "status": "success",
+            "data": {
+                "horizons": list(factor_analyzer.horizons),
+                "quantiles": quantiles,
+                "results": results
+            }
+        }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"因子分析失败: {str(e)}")
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """服务运行指标"""
+    return {
+        "status": "success",
+        "data": {
+            "coalescing": [backtest_flight.stats(), market_flight.stats()],
+            "admission": admission.stats(),
+            "http_cache": http_cache.stats(),
+            "websocket": hub.stats(),
+            "market_stream": market_replay.stats(),
+        }
+    }
+
 @app.get("/api/trading-dates", response_model=Dict[str, Any])
 async def get_trading_dates():
     """获取可用的交易日期范围"""
@@ -0,0 +1,197 @@
+import numpy as np
+import polars as pl
+from tiktrack import timed_stage
+
+
+class PerformanceAttribution:
+    """收益归因
+
+    由交易记录重建回测期间每日收盘后的持仓数量矩阵（交易日 × 持有过的转债），
+    与价格矩阵中对应的收盘价（缺失时沿用上一个有效价格，与持仓市值的更新规则一致）相乘，
+    得到每只转债每日的盈亏：前一交易日持仓数量 × 当日价格变动。交易均按当日收盘价成交，
+    因此各转债盈亏之和等于组合总资产的变化。在此基础上按 industry_1 汇总得到行业归因。
+    """
+
+    def __init__(self, strategy, data_manager):
+        """
+        Args:
+            strategy: 已完成回测的策略对象
+            data_manager: 回测使用的数据管理器（需要价格矩阵）
+        """
+        self.strategy = strategy
+        self.data_manager = data_manager
+        self.dates = list(strategy.dates_array)
+        self.portfolio_values = np.asarray(strategy.portfolio_values, dtype=float)
+        self.initial_capital = strategy.initial_capital
+        self._compute()
+
+    def _holdings_matrix(self):
+        """由交易记录重建每日收盘后的持仓数量矩阵"""
+        trades = pl.DataFrame(self.strategy.trade_records)
+        if trades.is_empty():
+            return [], np.zeros((len(self.dates), 0))
+
+        codes = trades.get_column('转债代码').cast(pl.Utf8).to_numpy().astype(str)
+        held_codes = np.unique(codes)
+        signed_quantity = np.where(
+            trades.get_column('操作').to_numpy() == '买入', 1.0, -1.0
+        ) * trades.get_column('数量').cast(pl.Float64).to_numpy()
+
+        date_array = np.array(self.dates, dtype='datetime64[us]')
+        trade_dates = trades.get_column('日期').cast(pl.Datetime('us')).to_numpy()
+        date_idx = np.searchsorted(date_array, trade_dates)
+
+        changes = np.zeros((len(self.dates), len(held_codes)))
+        np.add.at(changes, (date_idx, np.searchsorted(held_codes, codes)), signed_quantity)
+        return held_codes.tolist(), np.cumsum(changes, axis=0)
+
+    def _price_matrix(self, codes):
+        """回测交易日 × 持有过的转债的收盘价，无效价格沿用上一个有效价格"""
+        data_manager = self.data_manager
+        rows = np.array([data_manager.date_index[date] for date in self.dates])
+        cols = np.searchsorted(np.array(data_manager.codes), np.array(codes))
+        prices = np.asarray(data_manager.price_matrix)[np.ix_(rows, cols)]
+
+        valid = prices > 0
+        last_valid = np.where(valid, np.arange(len(rows))[:, None], 0)
+        np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+        filled = prices[last_valid, np.arange(len(cols))]
+        # 首个有效价格之前没有可沿用的价格
+        filled[~np.maximum.accumulate(valid, axis=0)] = np.nan
+        return filled
+
+    def _bond_info(self, codes):
+        """转债名称和行业（取最近一条记录）"""
+        data = self.data_manager.data
+        industry_column = next((col for col in ('industry_1', 'industry') if col in data.columns), None)
+        industry = pl.col(industry_column).cast(pl.Utf8) if industry_column else pl.lit(None, dtype=pl.Utf8)
+        info = (
+            data.lazy()
+            .filter(pl.col('code').cast(pl.Utf8).is_in(codes))
+            .group_by(pl.col('code').cast(pl.Utf8))
+            .agg([
+                pl.col('name').cast(pl.Utf8).last().alias('name'),
+                industry.last().alias('industry'),
+            ])
+            .collect()
+        )
+        return (
+            pl.DataFrame({'code': codes}, schema={'code': pl.Utf8})
+            .join(info, on='code', how='left')
+            .with_columns([
+                pl.col('name').fill_null(pl.col('code')),
+                pl.col('industry').fill_null('未知'),
+            ])
+        )
+
+    @timed_stage("收益归因")
+    def _compute(self):
+        codes, holdings = self._holdings_matrix()
+        self.codes = codes
+
+        pnl = np.zeros_like(holdings)
+        if codes and len(self.dates) > 1:
+            prices = self._price_matrix(codes)
+            price_change = np.nan_to_num(prices[1:] - prices[:-1], nan=0.0)
+            pnl[1:] = holdings[:-1] * price_change
+
+        # 对当日收益率的贡献：当日盈亏 / 前一交易日总资产
+        previous_values = np.concatenate([[self.initial_capital], self.portfolio_values[:-1]])
+        contribution = np.divide(
+            pnl, previous_values[:, None], out=np.zeros_like(pnl), where=previous_values[:, None] > 0
+        )
+
+        # 长表只保留持有过的（前一日有持仓或当日有盈亏的）行
+        previous_holdings = np.vstack([np.zeros((1, len(codes))), holdings[:-1]])
+        date_idx, code_idx = np.nonzero((previous_holdings != 0) | (pnl != 0))
+        info = self._bond_info(codes)
+        self.bond_daily = pl.concat([
+            pl.DataFrame({'trade_date': pl.Series(self.dates)[date_idx]}),
+            info[code_idx],
+            pl.DataFrame({
+                'quantity': previous_holdings[date_idx, code_idx],
+                'pnl': pnl[date_idx, code_idx],
+                'contribution': contribution[date_idx, code_idx],
+                'cum_pnl': np.cumsum(pnl, axis=0)[date_idx, code_idx],
+            }),
+        ], how='horizontal')
+
+        self.bond_summary = (
+            self.bond_daily.group_by(['code', 'name', 'industry'])
+            .agg([
+                pl.col('pnl').sum(),
+                (pl.col('quantity') > 0).sum().alias('holding_days'),
+            ])
+            .with_columns((pl.col('pnl') / self.initial_capital).alias('contribution'))
+            .sort('pnl', descending=True)
+        )
+
+        self.industry_daily = (
+            self.bond_daily.group_by(['trade_date', 'industry'])
+            .agg([pl.col('pnl').sum(), pl.col('contribution').sum()])
+            .sort(['trade_date', 'pnl'], descending=[False, True])
+        )
+        self.industry_summary = (
+            self.bond_summary.group_by('industry')
+            .agg([
+                pl.col('pnl').sum(),
+                pl.col('contribution').sum(),
+                pl.len().alias('bond_count'),
+            ])
+            .sort('pnl', descending=True)
+        )
+
+        total_change = self.portfolio_values[-1] - self.initial_capital if len(self.portfolio_values) else 0.0
+        self.total_pnl = float(pnl.sum())
+        self.residual = float(total_change - self.total_pnl)
+
+    def summary(self):
+        """归因汇总：总盈亏、未解释部分（成交价与沿用价格不一致等造成）以及涉及的转债和行业数"""
+        return {
+            "total_pnl": self.total_pnl,
+            "residual": self.residual,
+            "bond_count": self.bond_summary.height,
+            "industry_count": self.industry_summary.height,
+        }
+
+    def page(self, view='bonds', page=1, page_size=50, code=None, industry=None):
+        """
+        分页获取归因结果
+
+        Args:
+            view: bonds（转债累计贡献）、bond_daily（转债每日贡献）、
+                industries（行业累计贡献）、industry_daily（行业每日贡献）
+            page: 页码，从1开始
+            page_size: 每页条数
+            code: 只看某只转债（bonds / bond_daily）
+            industry: 只看某个行业
+
+        Returns:
+            dict: total（过滤后的总条数）、page、page_size、items（当前页的记录列表）
+        """
+        frames = {
+            'bonds': self.bond_summary,
+            'bond_daily': self.bond_daily,
+            'industries': self.industry_summary,
+            'industry_daily': self.industry_daily,
+        }
+        if view not in frames:
+            raise ValueError(f"无效的归因视图: {view}。有效选项: {list(frames)}")
+        if page < 1 or page_size < 1:
+            raise ValueError("page 和 page_size 必须为正整数")
+
+        frame = frames[view]
+        if code and 'code' in frame.columns:
+            frame = frame.filter(pl.col('code') == code)
+        if industry:
+            frame = frame.filter(pl.col('industry') == industry)
+
+        items = frame.slice((page - 1) * page_size, page_size)
+        if 'trade_date' in items.columns:
+            items = items.with_columns(pl.col('trade_date').dt.strftime('%Y-%m-%d'))
+        return {
+            "total": frame.height,
+            "page": page,
+            "page_size": page_size,
+            "items": items.to_dicts(),
+        }
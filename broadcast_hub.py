@@ -0,0 +1,155 @@
+import json
+import asyncio
+from collections import deque
+
+
+# 可订阅的主题
+TOPICS = (
+    "job_progress",   # 回测任务状态
+    "data_update",    # 数据更新通知
+    "market_delta",   # 行情快照和增量
+)
+
+
+class ClientConnection:
+    """单个WebSocket客户端
+
+    待发送消息放在有界队列中，由独立的发送任务逐条写入连接，慢客户端只会积压自己的队列。
+    带合并键的消息在队列中已有同键消息时直接替换（只保留最新的一条），
+    队列满时丢弃最旧的消息。
+    """
+
+    def __init__(self, client_id, websocket, max_queue):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.topics = set()
+        self._queue = deque()  # 元素为 [合并键, 消息文本]
+        self._pending_keys = {}  # {合并键: 队列中的元素}
+        self._ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.sender = None
+
+    def offer(self, payload, coalesce_key=None):
+        """放入一条已序列化的消息，不阻塞"""
+        if coalesce_key is not None and coalesce_key in self._pending_keys:
+            self._pending_keys[coalesce_key][1] = payload
+            self.coalesced += 1
+            return
+        if len(self._queue) >= self.max_queue:
+            old_key, _ = self._queue.popleft()
+            self._pending_keys.pop(old_key, None)
+            self.dropped += 1
+        entry = [coalesce_key, payload]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._pending_keys[coalesce_key] = entry
+        self._ready.set()
+
+    async def run_sender(self):
+        """发送任务：依次把队列中的消息写入连接，连接断开时结束"""
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    key, payload = self._queue.popleft()
+                    self._pending_keys.pop(key, None)
+                    await self.websocket.send_text(payload)
+                    self.sent += 1
+                self._ready.clear()
+        except Exception:
+            # 连接已关闭，由接收端负责注销
+            pass
+
+
+class BroadcastHub:
+    """WebSocket广播中心
+
+    客户端按主题订阅；发布时每条消息只序列化一次，再以文本放入各订阅者的有界队列，
+    发布本身不等待任何网络写入，大量连接时也不会阻塞事件循环。
+    """
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._clients = {}  # {ClientConnection: None}，保持连接顺序
+        self._subscribers = {topic: set() for topic in TOPICS}
+        self._sequence = 0
+        self.published = 0
+
+    def connect(self, client_id, websocket):
+        """登记一个已接受的连接并启动其发送任务"""
+        connection = ClientConnection(client_id, websocket, self.max_queue)
+        connection.sender = asyncio.ensure_future(connection.run_sender())
+        self._clients[connection] = None
+        return connection
+
+    def disconnect(self, connection):
+        """注销连接并停止其发送任务"""
+        self._clients.pop(connection, None)
+        for subscribers in self._subscribers.values():
+            subscribers.discard(connection)
+        if connection.sender is not None:
+            connection.sender.cancel()
+
+    def subscribe(self, connection, topics):
+        """订阅主题，返回无效的主题名"""
+        invalid = [topic for topic in topics if topic not in self._subscribers]
+        for topic in topics:
+            if topic in self._subscribers:
+                self._subscribers[topic].add(connection)
+                connection.topics.add(topic)
+        return invalid
+
+    def unsubscribe(self, connection, topics):
+        for topic in topics:
+            self._subscribers.get(topic, set()).discard(connection)
+            connection.topics.discard(topic)
+
+    @staticmethod
+    def encode(message):
+        return json.dumps(message, ensure_ascii=False, default=str, separators=(",", ":"))
+
+    def publish(self, topic, data, coalesce_key=None):
+        """
+        向主题的全部订阅者发布消息（需在事件循环线程中调用）
+
+        Args:
+            topic: 主题
+            data: 可JSON序列化的消息内容
+            coalesce_key: 合并键，慢客户端队列中同主题同键的旧消息会被新消息替换
+
+        Returns:
+            int: 收到消息的订阅者数
+        """
+        subscribers = self._subscribers.get(topic)
+        if subscribers is None:
+            raise ValueError(f"无效的主题: {topic}。有效选项: {list(TOPICS)}")
+        if not subscribers:
+            return 0
+
+        self._sequence += 1
+        self.published += 1
+        payload = self.encode({"topic": topic, "seq": self._sequence, "data": data})
+        key = (topic, coalesce_key) if coalesce_key is not None else None
+        for connection in subscribers:
+            connection.offer(payload, key)
+        return len(subscribers)
+
+    def send(self, connection, message):
+        """只发给单个连接（如订阅确认）"""
+        connection.offer(self.encode(message))
+
+    def stats(self):
+        """连接和队列指标"""
+        clients = list(self._clients)
+        return {
+            "clients": len(clients),
+            "subscribers": {topic: len(subscribers) for topic, subscribers in self._subscribers.items()},
+            "published": self.published,
+            "sent": sum(client.sent for client in clients),
+            "dropped": sum(client.dropped for client in clients),
+            "coalesced": sum(client.coalesced for client in clients),
+            "max_queue_depth": max((len(client._queue) for client in clients), default=0),
+        }
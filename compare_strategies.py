@@ -0,0 +1,170 @@
+import time
+from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from data_manager import DataManager, StreamingDataManager
+from create_strategy import create_strategy
+from get_top_bonds import get_top_bonds_for_configs
+from strategy_base import BaseStrategy
+
+
+# 对比表中展示的指标
+COMPARISON_METRICS = ["总收益率", "年化收益率", "最大回撤", "夏普比率", "交易次数", "胜率", "回测天数", "执行耗时"]
+
+
+def _format_date(date_obj):
+    """日期转为 YYYY-MM-DD 字符串"""
+    if isinstance(date_obj, (datetime, date)):
+        return date_obj.strftime('%Y-%m-%d')
+    return str(date_obj)
+
+
+def run_strategy_comparison(data_manager: DataManager, configs, max_workers=4):
+    """
+    并行运行多个策略配置并汇总对比结果
+    
+    选债范围相同的配置共享日期过滤、前置过滤和排名计算（见 get_top_bonds_for_configs），
+    各策略的逐日模拟在线程池中并发执行。
+    
+    Args:
+        data_manager: 已加载的数据管理器
+        configs: 策略配置列表
+        max_workers: 并发模拟的线程数
+    
+    Returns:
+        dict: 包含对齐后的日期轴、各策略净值序列(与日期轴对齐，无数据为None)和对比表
+    """
+    start_time = time.time()
+    
+    # 创建策略实例
+    strategies = []
+    processed_configs = []
+    for config in configs:
+        strategy, processed_config = create_strategy(config)
+        if strategy is None:
+            raise ValueError(f"创建策略失败: {config.get('name')}")
+        strategies.append(strategy)
+        processed_configs.append(processed_config)
+    
+    # 共享预处理：相同选债范围只过滤和排名一次
+    preprocess_start = time.time()
+    for config in processed_configs:
+        BaseStrategy.prepare_features(data_manager, config)
+    top_bonds_list = get_top_bonds_for_configs(data_manager.get_selection_frame, processed_configs)
+    preprocess_time = time.time() - preprocess_start
+    
+    # 并发运行各策略的逐日模拟
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(strategies)))) as executor:
+        futures = [
+            executor.submit(strategy.run_backtest, data_manager, config, top_bonds)
+            for strategy, config, top_bonds in zip(strategies, processed_configs, top_bonds_list)
+        ]
+        for future in futures:
+            future.result()
+    
+    # 对齐各策略的日期轴
+    all_dates = sorted({d for strategy in strategies for d in strategy.dates_array})
+    date_positions = {d: i for i, d in enumerate(all_dates)}
+    
+    nav_series = []
+    comparison_table = []
+    for strategy, config in zip(strategies, processed_configs):
+        nav = [None] * len(all_dates)
+        for d, value in zip(strategy.dates_array, strategy.portfolio_values):
+            nav[date_positions[d]] = float(value / strategy.initial_capital)
+        nav_series.append({"name": strategy.strategy_name, "nav": nav})
+        
+        performance = strategy.analyze_results()
+        row = {"name": strategy.strategy_name, "strategy_params": config.get("strategy_params", {})}
+        for metric in COMPARISON_METRICS:
+            row[metric] = performance.get(metric)
+        comparison_table.append(row)
+    
+    return {
+        "dates": [_format_date(d) for d in all_dates],
+        "nav_series": nav_series,
+        "comparison": comparison_table,
+        "preprocess_time": preprocess_time,
+        "execution_time": time.time() - start_time,
+    }
+
+
+def benchmark_rebalance_modes(data_manager: DataManager, config, drift_tolerances=(None, 0.2)):
+    """
+    对比全量再平衡和增量再平衡的回测速度与交易次数
+    
+    各模式共享同一份每日TOPN，只比较逐日模拟部分
+    
+    Args:
+        data_manager: 已加载的数据管理器
+        config: 策略配置
+        drift_tolerances: 增量模式下依次测试的偏离容忍带（None表示留存持仓不调整）
+    
+    Returns:
+        list: 每种模式一行，包含交易次数、执行耗时、每秒回测天数和主要绩效指标
+    """
+    _, processed_config = create_strategy(config)
+    BaseStrategy.prepare_features(data_manager, processed_config)
+    top_bonds = get_top_bonds_for_configs(data_manager.get_selection_frame, [processed_config])[0]
+    
+    variants = [("full", None)] + [("incremental", tolerance) for tolerance in drift_tolerances]
+    rows = []
+    for mode, tolerance in variants:
+        variant_config = dict(processed_config, rebalance_mode=mode, drift_tolerance=tolerance)
+        strategy, _ = create_strategy(variant_config)
+        strategy.run_backtest(data_manager, variant_config, top_bonds)
+        performance = strategy.analyze_results()
+        rows.append({
+            "再平衡模式": mode,
+            "偏离容忍带": tolerance,
+            "交易次数": performance.get("交易次数"),
+            "执行耗时": strategy.execution_time,
+            "每秒回测天数": len(strategy.dates_array) / strategy.execution_time if strategy.execution_time > 0 else None,
+            "年化收益率": performance.get("年化收益率"),
+            "最大回撤": performance.get("最大回撤"),
+        })
+        print(f"{mode}(容忍带={tolerance}): 交易 {rows[-1]['交易次数']} 次, 耗时 {strategy.execution_time:.2f}秒")
+    return rows
+
+
+def check_streaming_parity(data_manager: DataManager, config, window_days=40):
+    """
+    用同一配置分别运行内存回测和流式回测，对比净值、交易次数和最终资产
+    
+    两种模式的每日排名都按 (得分降序, 代码升序) 选债，结果应当一致；窗口大小刻意取得较小，
+    使窗口边界落在回测区间内
+    
+    Args:
+        data_manager: 已加载的（内存）数据管理器
+        config: 策略配置（包括 rebalance_schedule / rebalance_mode）
+        window_days: 流式回测的窗口大小
+    
+    Returns:
+        dict: 两种模式的最终资产和交易次数、每日净值的最大绝对差，以及是否一致
+    """
+    _, processed_config = create_strategy(config)
+    
+    results = {}
+    for label, manager in (
+        ("内存", data_manager),
+        ("流式", StreamingDataManager(data_manager.data_path, window_days=window_days, date_column=data_manager.date_column)),
+    ):
+        strategy, _ = create_strategy(processed_config)
+        strategy.run_backtest(manager, processed_config)
+        results[label] = strategy
+    
+    memory, streaming = results["内存"], results["流式"]
+    nav_diff = (
+        float(np.max(np.abs(memory.portfolio_values - streaming.portfolio_values)))
+        if len(memory.portfolio_values) == len(streaming.portfolio_values) else float("inf")
+    )
+    report = {
+        "内存最终资产": float(memory.portfolio_values[-1]) if len(memory.portfolio_values) else None,
+        "流式最终资产": float(streaming.portfolio_values[-1]) if len(streaming.portfolio_values) else None,
+        "内存交易次数": len(memory.trade_records),
+        "流式交易次数": len(streaming.trade_records),
+        "净值最大差异": nav_diff,
+    }
+    report["一致"] = nav_diff <= 1e-6 and report["内存交易次数"] == report["流式交易次数"]
+    print(f"内存/流式回测对比: {report}")
+    return report
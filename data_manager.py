@@ -1,29 +1,78 @@
 import polars as pl
+import numpy as np
 import os
 import re
+import json
+import hashlib
+from bisect import bisect_left, bisect_right
 from tiktrack import timed_stage# 导入共享工具模块中的计时装饰器
 from datetime import datetime
+from filter_compiler import compile_filters, normalize_filters
+from feature_store import FeatureStore, is_feature_name
+from factor_expr import DerivedFactorCache
+
+
+# 快照格式版本，快照结构变化时递增以使旧快照失效
+SNAPSHOT_VERSION = 1
+
+# 预定义的选债范围（与 FactorConfigGenerator.basic_filters 保持一致）
+DEFAULT_UNIVERSES = {
+    "basic": {
+        "left_years": [">", 0.5],  # 剩余年限大于0.5年
+        "list_days": [">", 30],    # 上市超过30天
+    },
+}
+
+# 全市场等权基准的名称，其他基准名称为已登记的选债范围
+MARKET_BENCHMARK = "market"
 
 
 class DataManager:
     """数据管理器，用于加载和管理可转债数据"""
     
-    def __init__(self, data_path, date_column=None):
+    def __init__(self, data_path, date_column=None, use_snapshot=True, snapshot_dir=None):
         """初始化数据管理器
         
         Args:
             data_path: 数据文件路径
             date_column: 日期列名，默认为None（自动检测）
+            use_snapshot: 是否使用预处理快照（按日期排序的Arrow IPC文件 + 日期偏移索引 + 价格矩阵），
+                默认开启。快照以源文件哈希校验，命中时以内存映射方式加载
+            snapshot_dir: 快照目录，默认为数据文件所在目录下的 .snapshot/<文件名>
         """
         self.data_path = data_path
         self.date_column = date_column
-        
-        # 加载数据
-        print(f"正在加载数据: {data_path}")
-        self._load_data(data_path)
-        
-        # 检查数据结构
-        self._handle_data_structure()
+        self.use_snapshot = use_snapshot
+        if snapshot_dir is None:
+            base_name = os.path.splitext(os.path.basename(data_path))[0]
+            snapshot_dir = os.path.join(os.path.dirname(data_path) or '.', '.snapshot', base_name)
+        self.snapshot_dir = snapshot_dir
+        
+        # 源文件指纹，用于快照校验，也作为数据集版本号
+        self.source_fingerprint = None
+        
+        # 选债范围：名称 -> 过滤规则，以及按日期排序的数据行对齐的位压缩掩码
+        self.universe_filters = dict(DEFAULT_UNIVERSES)
+        self.universe_masks = {}
+        
+        # 等权基准日收益率：名称 -> 与交易日对齐的数组
+        self.benchmark_returns = {}
+        
+        # 优先从快照加载，快照不存在或已失效时重新处理原始数据
+        if not (use_snapshot and self._load_snapshot()):
+            # 加载数据
+            print(f"正在加载数据: {data_path}")
+            self._load_data(data_path)
+            
+            # 检查数据结构
+            self._handle_data_structure()
+            
+            # 建立日期偏移索引和价格矩阵
+            self._build_date_index()
+            self._build_price_matrix()
+            
+            if use_snapshot:
+                self._write_snapshot()
         
         # 创建每日数据缓存
         self.daily_data_cache = {}
@@ -34,6 +83,13 @@ class DataManager:
         # 预处理和缓存每日数据
         self._preprocess_daily_data()
         
+        # 时间序列特征库，按需计算滚动特征，结果存放在与数据行对齐的特征表中，不修改 self.data
+        self.feature_store = FeatureStore(self)
+        self.feature_data = pl.DataFrame()
+        
+        # 派生因子（表达式）计算结果缓存
+        self.derived_factor_cache = DerivedFactorCache(self)
+        
         print(f"数据加载完成，共有 {self.data.height} 条记录，{len(self.trading_dates)} 个交易日")
     
     @timed_stage("数据文件加载")
@@ -62,9 +118,426 @@ class DataManager:
         except Exception as e:
             print(f"将日期列转换为datetime类型失败: {e}")
         
+        # 按日期（及代码）排序，使同一交易日的数据在内存中连续，便于按偏移切片
+        self.data = self.data.sort([self.date_column, "code"])
+        
         # 提取所有交易日期并排序
         self.trading_dates = sorted(self.data.get_column(self.date_column).unique().to_list())
 
+    @timed_stage("建立日期索引")
+    def _build_date_index(self):
+        """建立日期偏移索引
+        
+        数据已按日期排序，第i个交易日的数据位于 [date_offsets[i], date_offsets[i+1]) 行区间
+        """
+        counts = (
+            self.data.group_by(self.date_column)
+            .agg(pl.len().alias("count"))
+            .sort(self.date_column)
+            .get_column("count")
+            .to_numpy()
+        )
+        self.date_offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.date_offsets[1:])
+    
+    @timed_stage("建立价格矩阵")
+    def _build_price_matrix(self):
+        """建立收盘价矩阵（交易日 × 转债代码）
+        
+        当日无数据的转债为NaN，收盘价缺失的记为0，与价格字典的约定保持一致
+        """
+        self.codes = sorted(self.data.get_column("code").cast(pl.Utf8).unique().to_list())
+        row_date_idx, row_code_idx = self.get_row_indices()
+        
+        close = self.data.get_column("close").cast(pl.Float64).fill_null(0).to_numpy()
+        self.price_matrix = np.full((len(self.trading_dates), len(self.codes)), np.nan)
+        self.price_matrix[row_date_idx, row_code_idx] = close
+    
+    def get_row_indices(self):
+        """每行数据在价格矩阵中的位置 (交易日序号, 转债代码序号)，首次调用时计算并缓存
+        
+        Returns:
+            tuple: (row_date_idx, row_code_idx) 两个与数据行对齐的整数数组
+        """
+        if getattr(self, "_row_indices", None) is None:
+            codes_array = np.array(self.codes)
+            code_values = self.data.get_column("code").cast(pl.Utf8).to_numpy().astype(str)
+            row_code_idx = np.searchsorted(codes_array, code_values)
+            row_date_idx = np.repeat(np.arange(len(self.date_offsets) - 1), np.diff(self.date_offsets))
+            self._row_indices = (row_date_idx, row_code_idx)
+        return self._row_indices
+    
+    @timed_stage("建立转债代码索引")
+    def _build_code_index(self):
+        """建立转债代码到数据行的索引
+        
+        对行按 (转债代码, 交易日) 做一次稳定排序得到行号排列 code_order，
+        第j只转债的全部行为 code_order[code_offsets[j]:code_offsets[j+1]]，且按日期先后排列
+        """
+        row_date_idx, row_code_idx = self.get_row_indices()
+        # 数据已按日期排序，按代码做稳定排序后同一代码内仍按日期排列
+        self.code_order = np.argsort(row_code_idx, kind='stable')
+        self.code_offsets = np.zeros(len(self.codes) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row_code_idx, minlength=len(self.codes)), out=self.code_offsets[1:])
+        self._code_row_dates = row_date_idx[self.code_order]
+    
+    def get_bond_history(self, code, start_date=None, end_date=None, columns=None) -> pl.DataFrame:
+        """获取单只转债在日期区间内的历史数据
+        
+        通过代码索引二分定位，只读取该转债的行，不需要扫描全表
+        
+        Args:
+            code: 转债代码
+            start_date: 开始日期
+            end_date: 结束日期
+            columns: 需要的列，默认全部列；trade_date 总是包含在结果中
+            
+        Returns:
+            pl.DataFrame: 按日期排列的历史数据，代码不存在时返回None
+        """
+        if getattr(self, "code_order", None) is None:
+            self._build_code_index()
+        
+        code_pos = bisect_left(self.codes, code)
+        if code_pos >= len(self.codes) or self.codes[code_pos] != code:
+            return None
+        
+        begin, finish = int(self.code_offsets[code_pos]), int(self.code_offsets[code_pos + 1])
+        row_dates = self._code_row_dates[begin:finish]
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = datetime.fromisoformat(end_date)
+        if start_date:
+            begin += int(np.searchsorted(row_dates, bisect_left(self.trading_dates, start_date)))
+        if end_date:
+            finish = int(self.code_offsets[code_pos]) + int(
+                np.searchsorted(row_dates, bisect_right(self.trading_dates, end_date))
+            )
+        
+        frame = self.data
+        if columns:
+            frame = frame.select([self.date_column] + [col for col in columns if col != self.date_column])
+        return frame[self.code_order[begin:max(begin, finish)]]
+    
+    def _compute_source_hash(self):
+        """计算源数据文件的哈希值"""
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(self.data_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+    
+    def _snapshot_paths(self):
+        """快照各文件的路径"""
+        return {
+            "meta": os.path.join(self.snapshot_dir, "meta.json"),
+            "data": os.path.join(self.snapshot_dir, "data.arrow"),
+            "offsets": os.path.join(self.snapshot_dir, "date_offsets.npy"),
+            "prices": os.path.join(self.snapshot_dir, "price_matrix.npy"),
+        }
+    
+    @timed_stage("加载数据快照")
+    def _load_snapshot(self):
+        """尝试从快照加载数据
+        
+        源文件大小和修改时间与快照记录一致时直接信任快照；不一致时重新计算源文件哈希比对，
+        哈希一致（例如文件被复制或touch）则沿用快照。
+        
+        Returns:
+            bool: 是否成功从快照加载
+        """
+        paths = self._snapshot_paths()
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+        
+        try:
+            with open(paths["meta"], 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            
+            if meta.get("version") != SNAPSHOT_VERSION:
+                print("数据快照版本不匹配，将重新生成")
+                return False
+            
+            stat = os.stat(self.data_path)
+            if meta.get("source_size") != stat.st_size or meta.get("source_mtime_ns") != stat.st_mtime_ns:
+                if meta.get("source_hash") != self._compute_source_hash():
+                    print("源数据文件已变化，数据快照失效，将重新生成")
+                    return False
+            
+            # 以内存映射方式加载，多个进程可共享操作系统的页缓存
+            self.data = pl.read_ipc(paths["data"], memory_map=True)
+            self.date_offsets = np.load(paths["offsets"], mmap_mode='r')
+            self.price_matrix = np.load(paths["prices"], mmap_mode='r')
+        except Exception as e:
+            print(f"加载数据快照失败，将重新处理原始数据: {e}")
+            return False
+        
+        self.date_column = meta["date_column"]
+        self.codes = meta["codes"]
+        self.source_fingerprint = meta["source_hash"]
+        self.trading_dates = self.data.get_column(self.date_column).gather(np.asarray(self.date_offsets[:-1])).to_list()
+        print(f"已从快照加载数据: {self.snapshot_dir}")
+        return True
+    
+    @timed_stage("写入数据快照")
+    def _write_snapshot(self):
+        """将预处理后的数据写入快照目录
+        
+        各文件先写入临时文件再原子替换，meta.json最后写入，作为快照完整的标志
+        """
+        paths = self._snapshot_paths()
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            stat = os.stat(self.data_path)
+            self.source_fingerprint = self._compute_source_hash()
+            
+            # 删除旧的meta，避免写入过程中被其他进程读到不完整的快照
+            if os.path.exists(paths["meta"]):
+                os.remove(paths["meta"])
+            
+            # IPC文件不压缩，才能被内存映射
+            self.data.write_ipc(paths["data"] + ".tmp", compression="uncompressed")
+            os.replace(paths["data"] + ".tmp", paths["data"])
+            
+            with open(paths["offsets"] + ".tmp", 'wb') as f:
+                np.save(f, self.date_offsets)
+            os.replace(paths["offsets"] + ".tmp", paths["offsets"])
+            
+            with open(paths["prices"] + ".tmp", 'wb') as f:
+                np.save(f, self.price_matrix)
+            os.replace(paths["prices"] + ".tmp", paths["prices"])
+            
+            meta = {
+                "version": SNAPSHOT_VERSION,
+                "source_path": os.path.abspath(self.data_path),
+                "source_size": stat.st_size,
+                "source_mtime_ns": stat.st_mtime_ns,
+                "source_hash": self.source_fingerprint,
+                "date_column": self.date_column,
+                "codes": self.codes,
+            }
+            with open(paths["meta"] + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(paths["meta"] + ".tmp", paths["meta"])
+            print(f"数据快照已保存至: {self.snapshot_dir}")
+        except Exception as e:
+            # 快照只是加速手段，写入失败（如文件被其他进程映射占用）不影响本次运行
+            print(f"写入数据快照失败: {e}")
+    
+    def register_universe(self, name, filters):
+        """登记一个命名的选债范围
+        
+        Args:
+            name: 范围名称，可在配置的 strategy_params.universe 中引用
+            filters: 过滤规则，格式同 strategy_params.filters
+        """
+        self.universe_filters[name] = filters
+        self.universe_masks.pop(name, None)
+    
+    def _universe_mask_path(self, filters):
+        """选债范围掩码在快照目录中的路径，文件名包含过滤规则和数据源的指纹"""
+        rule_hash = hashlib.blake2b(normalize_filters(filters).encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(self.snapshot_dir, f"universe_{self.source_fingerprint}_{rule_hash}.npy")
+    
+    @timed_stage("计算选债范围掩码")
+    def get_universe_mask(self, name):
+        """获取命名选债范围的位压缩掩码（np.packbits结果，按日期排序的数据行对齐）
+        
+        首次使用时对全量数据计算一次，之后在内存中复用；启用快照时同时保存到快照目录供其他进程复用
+        """
+        if name in self.universe_masks:
+            return self.universe_masks[name]
+        if name not in self.universe_filters:
+            raise ValueError(f"未定义的选债范围: {name}。可用范围: {list(self.universe_filters)}")
+        
+        filters = self.universe_filters[name]
+        mask_path = self._universe_mask_path(filters) if (self.use_snapshot and self.source_fingerprint) else None
+        
+        if mask_path and os.path.exists(mask_path):
+            packed = np.load(mask_path)
+        else:
+            mask = self.data.select(compile_filters(filters).fill_null(False)).to_series().to_numpy()
+            packed = np.packbits(mask)
+            if mask_path:
+                try:
+                    np.save(mask_path, packed)
+                except Exception as e:
+                    print(f"保存选债范围掩码失败: {e}")
+        
+        self.universe_masks[name] = packed
+        return packed
+    
+    def _combine_universe(self, spec):
+        """按规则组合选债范围掩码（位运算）
+        
+        spec 可以是范围名称、名称列表（取交集），或 {"and": [...]}、{"or": [...]}、{"not": spec}
+        """
+        if isinstance(spec, str):
+            return self.get_universe_mask(spec)
+        if isinstance(spec, list):
+            spec = {"and": spec}
+        if isinstance(spec, dict) and len(spec) == 1:
+            op, value = next(iter(spec.items()))
+            if op == "and":
+                return np.bitwise_and.reduce([self._combine_universe(item) for item in value])
+            if op == "or":
+                return np.bitwise_or.reduce([self._combine_universe(item) for item in value])
+            if op == "not":
+                return np.invert(self._combine_universe(value))
+        raise ValueError(f"无效的选债范围规则: {spec}")
+    
+    def universe_expression(self, spec):
+        """将选债范围规则转换为等价的过滤表达式（用于没有全量数据的场景，如流式回测）"""
+        if isinstance(spec, str):
+            if spec not in self.universe_filters:
+                raise ValueError(f"未定义的选债范围: {spec}。可用范围: {list(self.universe_filters)}")
+            return compile_filters(self.universe_filters[spec])
+        if isinstance(spec, list):
+            spec = {"and": spec}
+        if isinstance(spec, dict) and len(spec) == 1:
+            op, value = next(iter(spec.items()))
+            if op == "and":
+                return pl.all_horizontal([self.universe_expression(item) for item in value])
+            if op == "or":
+                return pl.any_horizontal([self.universe_expression(item) for item in value])
+            if op == "not":
+                return ~self.universe_expression(value)
+        raise ValueError(f"无效的选债范围规则: {spec}")
+    
+    def _date_row_range(self, start_date=None, end_date=None):
+        """日期区间对应的数据行区间 [start_row, end_row)"""
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = datetime.fromisoformat(end_date)
+        start_idx = bisect_left(self.trading_dates, start_date) if start_date else 0
+        end_idx = bisect_right(self.trading_dates, end_date) if end_date else len(self.trading_dates)
+        return int(self.date_offsets[start_idx]), int(self.date_offsets[max(start_idx, end_idx)])
+    
+    def get_universe_data(self, spec, start_date=None, end_date=None) -> pl.DataFrame:
+        """获取选债范围内的数据
+        
+        先按日期偏移切出日期区间，再用预先计算的掩码筛选行，不需要重新计算过滤条件
+        
+        Args:
+            spec: 选债范围规则，见 _combine_universe
+            start_date: 开始日期
+            end_date: 结束日期
+        """
+        return self._apply_universe(self.data, spec, start_date, end_date)
+    
+    def _apply_universe(self, frame, spec, start_date=None, end_date=None) -> pl.DataFrame:
+        """对与数据行对齐的frame按日期偏移切片并应用选债范围掩码"""
+        start_row, end_row = self._date_row_range(start_date, end_date)
+        mask = np.unpackbits(self._combine_universe(spec), count=self.data.height).astype(bool)
+        return frame.slice(start_row, end_row - start_row).filter(pl.Series(mask[start_row:end_row]))
+    
+    @timed_stage("计算基准收益率")
+    def get_benchmark_returns(self, name=MARKET_BENCHMARK):
+        """获取等权基准的日收益率（与交易日对齐，首个交易日为0）
+        
+        第t日的收益率为前一交易日在范围内、且两日均有有效收盘价的转债日收益率的均值，
+        由价格矩阵一次性向量化计算，每个数据集只计算一次
+        
+        Args:
+            name: "market" 表示全部转债，其他为已登记的选债范围名称（如 "basic"）
+        """
+        if name in self.benchmark_returns:
+            return self.benchmark_returns[name]
+        
+        # 收盘价缺失时价格矩阵中记为0，视为无效价格
+        prices = np.where(self.price_matrix > 0, self.price_matrix, np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1
+        
+        if name != MARKET_BENCHMARK:
+            # 按前一交易日是否在选债范围内决定是否计入
+            mask = np.unpackbits(self.get_universe_mask(name), count=self.data.height).astype(bool)
+            row_date_idx, row_code_idx = self.get_row_indices()
+            members = np.zeros(self.price_matrix.shape, dtype=bool)
+            members[row_date_idx[mask], row_code_idx[mask]] = True
+            returns = np.where(members[:-1], returns, np.nan)
+        
+        valid = ~np.isnan(returns)
+        counts = valid.sum(axis=1)
+        sums = np.where(valid, returns, 0.0).sum(axis=1)
+        daily_returns = np.zeros(len(self.trading_dates))
+        daily_returns[1:] = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+        
+        self.benchmark_returns[name] = daily_returns
+        return daily_returns
+    
+    def get_benchmark_nav(self, name=MARKET_BENCHMARK, start_date=None, end_date=None):
+        """获取等权基准在日期区间内的净值序列（区间首日为1）
+        
+        Returns:
+            tuple: (交易日列表, 净值数组)
+        """
+        daily_returns = self.get_benchmark_returns(name)
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = datetime.fromisoformat(end_date)
+        start_idx = bisect_left(self.trading_dates, start_date) if start_date else 0
+        end_idx = bisect_right(self.trading_dates, end_date) if end_date else len(self.trading_dates)
+        if end_idx <= start_idx:
+            return [], np.array([])
+        
+        period_returns = daily_returns[start_idx:end_idx].copy()
+        period_returns[0] = 0.0
+        return self.trading_dates[start_idx:end_idx], np.cumprod(1 + period_returns)
+    
+    def get_selection_frame(self, config) -> pl.DataFrame:
+        """获取用于选债排名的数据
+        
+        - 配置了 strategy_params.universe 时只返回该范围内、日期区间内的数据
+        - 配置了 strategy_params.derived_factors（{因子名: 表达式}）时，加入缓存的派生因子列；
+          截面函数（zscore/rank/demean）在选债范围内计算，而不是在全市场计算
+        """
+        strategy_params = config.get("strategy_params", {})
+        universe = strategy_params.get("universe")
+        derived_factors = strategy_params.get("derived_factors")
+        
+        frame = self.get_feature_data()
+        if not universe:
+            if derived_factors:
+                frame = frame.with_columns(self.derived_factor_cache.get_columns(derived_factors, frame))
+            return frame
+        
+        # 先在选债范围的全区间数据上计算（并缓存）派生因子，再按日期区间切片
+        mask = np.unpackbits(self._combine_universe(universe), count=self.data.height).astype(bool)
+        frame = frame.filter(pl.Series(mask))
+        if derived_factors:
+            frame = frame.with_columns(self.derived_factor_cache.get_columns(derived_factors, frame, universe))
+        start_row, end_row = self._date_row_range(config.get("start_date"), config.get("end_date"))
+        offset = int(mask[:start_row].sum())
+        return frame.slice(offset, int(mask[start_row:end_row].sum()))
+    
+    def ensure_features(self, names):
+        """确保配置中引用的时间序列特征（如 ret_20d、vol_20d、turnover_5d）已加入数据
+        
+        Args:
+            names: 列名列表，非特征名会被忽略
+        """
+        return self.feature_store.ensure(names)
+    
+    def _add_features(self, columns: pl.DataFrame):
+        """加入与数据行对齐的特征列
+        
+        特征单独存放，self.data 和每日数据切片保持不变，市场数据接口的返回结构和相关缓存不受影响；
+        新特征表整体替换旧表，正在读取旧表的请求不受影响
+        """
+        if self.feature_data.width:
+            columns = pl.concat([self.feature_data, columns], how="horizontal")
+        self.feature_data = columns
+    
+    def get_feature_data(self) -> pl.DataFrame:
+        """全量数据加上已计算的时间序列特征列（用于选债排名、派生因子和因子分析）"""
+        feature_data = self.feature_data
+        if not feature_data.width:
+            return self.get_all_data()
+        return pl.concat([self.get_all_data(), feature_data], how="horizontal")
     
     def get_trading_dates(self):
         """获取所有交易日期"""
@@ -72,35 +545,33 @@ class DataManager:
     
     @timed_stage("预处理每日数据")
     def _preprocess_daily_data(self):
-        """预处理和缓存每个交易日的数据"""
+        """预处理和缓存每个交易日的数据
+        
+        数据按日期连续存放，每日数据是按偏移索引得到的零拷贝切片；价格字典在首次访问时由价格矩阵生成
+        """
         print(f"开始预处理每日数据，共 {len(self.trading_dates)} 个交易日...")
         
-        total_dates = len(self.trading_dates)
+        # 日期到交易日序号的映射
+        self.date_index = {date: i for i, date in enumerate(self.trading_dates)}
         
         for i, date in enumerate(self.trading_dates):
-            # 筛选当日数据
-            daily_data = self.data.filter(pl.col(self.date_column) == date)
+            start = int(self.date_offsets[i])
+            length = int(self.date_offsets[i + 1]) - start
             
-            # 缓存处理后的数据
-            self.daily_data_cache[date] = daily_data
-            
-            # 预处理并缓存价格字典 - 新增
-            self._preprocess_daily_prices(date, daily_data)
+            # 缓存当日数据切片
+            self.daily_data_cache[date] = self.data.slice(start, length)
     
-    def _preprocess_daily_prices(self, date, daily_data):
-        """预处理并缓存每日价格字典 - 新增方法"""
-        # 提取代码和收盘价
-        code_close_df = daily_data.select(["code", "close"])
+    def _preprocess_daily_prices(self, date):
+        """由价格矩阵生成并缓存每日价格字典 - 新增方法"""
+        row = self.price_matrix[self.date_index[date]]
+        valid_idx = np.flatnonzero(~np.isnan(row))
         
         # 创建价格字典
-        prices_dict = {}
-        for row in code_close_df.iter_rows(named=True):
-            code = str(row["code"])
-            price = row["close"]
-            prices_dict[code] = float(price) if price is not None else 0
+        prices_dict = {self.codes[j]: float(row[j]) for j in valid_idx}
         
         # 缓存价格字典
         self.daily_prices_cache[date] = prices_dict
+        return prices_dict
     
     @timed_stage("获取每日价格字典")
     def get_daily_prices(self, date):
@@ -119,6 +590,10 @@ class DataManager:
         if date in self.daily_prices_cache:
             return self.daily_prices_cache[date]
         
+        # 交易日的价格字典在首次访问时生成
+        if date in self.date_index:
+            return self._preprocess_daily_prices(date)
+        
         # 如果缓存中没有，则尝试找最近的日期
         if len(self.trading_dates) > 0:
             nearest_date = min(self.trading_dates, key=lambda x: abs((x - date).total_seconds()))
@@ -127,6 +602,8 @@ class DataManager:
             # 检查最近的日期是否在缓存中
             if nearest_date in self.daily_prices_cache:
                 return self.daily_prices_cache[nearest_date]
+            if nearest_date in self.date_index:
+                return self._preprocess_daily_prices(nearest_date)
         
         # 如果缓存中没有，则临时创建价格字典
         print(f"警告: 日期 {date} 的价格数据不在缓存中，将实时处理")
@@ -228,3 +705,119 @@ class DataManager:
             print("警告: 筛选后没有交易日符合条件")
             
         return filtered_dates
+
+
+class StreamingDataManager(DataManager):
+    """流式数据管理器
+    
+    不把整个数据集读入内存，而是通过 scan_parquet 按交易日窗口读取（借助行组统计信息跳过无关行组），
+    回测时逐窗口计算排名并逐日推进，峰值内存以单个窗口为上限。
+    get_daily_data / get_daily_prices 只对当前窗口内的日期有效。
+    """
+    
+    def __init__(self, data_path, window_days=60, date_column=None):
+        """初始化流式数据管理器
+        
+        Args:
+            data_path: parquet数据文件路径
+            window_days: 每个窗口包含的交易日数量
+            date_column: 日期列名，默认为 trade_date
+        """
+        if not os.path.exists(data_path):
+            raise FileNotFoundError(f"数据文件不存在: {data_path}")
+        if not (data_path.endswith('.pq') or data_path.endswith('.parquet')):
+            raise ValueError(f"流式模式只支持parquet文件: {data_path}")
+        
+        self.data_path = data_path
+        self.date_column = date_column or "trade_date"
+        self.window_days = window_days
+        self.source_fingerprint = None
+        self.use_snapshot = False
+        self.universe_filters = dict(DEFAULT_UNIVERSES)
+        self.universe_masks = {}
+        self.benchmark_returns = {}
+        self.feature_store = None
+        self.feature_data = pl.DataFrame()
+        
+        self.scan = pl.scan_parquet(data_path).with_columns(pl.col(self.date_column).cast(pl.Datetime))
+        
+        # 只读取日期列得到交易日历
+        self.trading_dates = sorted(
+            self.scan.select(pl.col(self.date_column).unique()).collect().get_column(self.date_column).to_list()
+        )
+        
+        # 当前窗口的数据和缓存
+        self.data = None
+        self.date_index = {}
+        self.daily_data_cache = {}
+        self.daily_prices_cache = {}
+        
+        print(f"流式数据源就绪，共 {len(self.trading_dates)} 个交易日，窗口大小 {window_days} 个交易日")
+    
+    def get_all_data(self) -> pl.DataFrame:
+        """流式模式下不提供全量数据"""
+        raise ValueError("流式数据管理器不支持获取全量数据，请使用 iter_windows 按窗口读取")
+    
+    def get_bond_history(self, code, start_date=None, end_date=None, columns=None) -> pl.DataFrame:
+        """流式模式下按日期区间扫描数据源读取单只转债的历史"""
+        scan = self.scan.filter(pl.col("code").cast(pl.Utf8) == code)
+        if isinstance(start_date, str):
+            start_date = datetime.fromisoformat(start_date)
+        if isinstance(end_date, str):
+            end_date = datetime.fromisoformat(end_date)
+        if start_date:
+            scan = scan.filter(pl.col(self.date_column) >= start_date)
+        if end_date:
+            scan = scan.filter(pl.col(self.date_column) <= end_date)
+        if columns:
+            scan = scan.select([self.date_column] + [col for col in columns if col != self.date_column])
+        history = scan.collect().sort(self.date_column)
+        return history if not history.is_empty() else None
+    
+    def ensure_features(self, names):
+        """流式模式下窗口之间没有回看数据，不支持时间序列特征"""
+        features = [name for name in names if is_feature_name(name)]
+        if features:
+            raise ValueError(f"流式回测不支持时间序列特征: {features}")
+        return []
+    
+    @timed_stage("读取数据窗口")
+    def _load_window(self, window_dates):
+        """读取一个日期窗口的数据，并重建当前窗口的每日缓存"""
+        window_data = (
+            self.scan
+            .filter(pl.col(self.date_column).is_between(window_dates[0], window_dates[-1]))
+            .collect()
+            .sort([self.date_column, "code"])
+        )
+        
+        # 释放上一个窗口的缓存
+        self.data = window_data
+        self.date_index = {}
+        self.daily_data_cache = {}
+        self.daily_prices_cache = {}
+        
+        for daily_data in window_data.partition_by(self.date_column, maintain_order=True):
+            date = daily_data.get_column(self.date_column)[0]
+            self.daily_data_cache[date] = daily_data
+            
+            codes = daily_data.get_column("code").cast(pl.Utf8).to_list()
+            closes = daily_data.get_column("close").cast(pl.Float64).fill_null(0).to_list()
+            self.daily_prices_cache[date] = dict(zip(codes, closes))
+        
+        return window_data
+    
+    def iter_windows(self, start_date=None, end_date=None):
+        """按交易日窗口依次读取数据
+        
+        Args:
+            start_date: 开始日期
+            end_date: 结束日期
+            
+        Yields:
+            tuple: (窗口内的交易日列表, 窗口数据DataFrame)
+        """
+        dates = self.get_trading_dates_range(start_date, end_date)
+        for start in range(0, len(dates), self.window_days):
+            window_dates = dates[start:start + self.window_days]
+            yield window_dates, self._load_window(window_dates)
@@ -0,0 +1,169 @@
+import time
+import numpy as np
+import polars as pl
+from data_manager import DataManager
+from tiktrack import timed_stage
+
+
+class FactorAnalyzer:
+    """因子分析器
+
+    不运行完整回测，直接在DataManager的数据上批量计算因子的截面有效性：
+    - 未来收益率只按价格矩阵计算一次（默认1/5/20个交易日）
+    - 每日Rank IC、IC均值/标准差/IR、分位数组合收益、头部分位换手率
+    所有因子和持有期在一次分组聚合中完成
+    """
+
+    def __init__(self, data_manager: DataManager, horizons=(1, 5, 20)):
+        """
+        Args:
+            data_manager: 已加载的数据管理器
+            horizons: 未来收益率的持有期（交易日）
+        """
+        self.data_manager = data_manager
+        self.horizons = tuple(horizons)
+        self.forward_returns = {}
+        self._compute_forward_returns()
+
+    @timed_stage("计算未来收益率")
+    def _compute_forward_returns(self):
+        """按价格矩阵计算各持有期的未来收益率，并按数据行展开"""
+        # 收盘价缺失时价格矩阵中记为0，这里视为无效价格
+        prices = np.where(self.data_manager.price_matrix > 0, self.data_manager.price_matrix, np.nan)
+        row_date_idx, row_code_idx = self.data_manager.get_row_indices()
+
+        for horizon in self.horizons:
+            forward = np.full_like(prices, np.nan)
+            if horizon < len(prices):
+                forward[:-horizon] = prices[horizon:] / prices[:-horizon] - 1
+            self.forward_returns[horizon] = forward[row_date_idx, row_code_idx]
+
+    def _analysis_frame(self, factors, start_date=None, end_date=None, universe=None):
+        """构建分析用的长表：交易日序号、代码序号、因子值、各持有期未来收益率"""
+        data_manager = self.data_manager
+        start_row, end_row = data_manager._date_row_range(start_date, end_date)
+        row_date_idx, row_code_idx = data_manager.get_row_indices()
+
+        columns = {
+            "date_idx": row_date_idx[start_row:end_row],
+            "code_idx": row_code_idx[start_row:end_row],
+        }
+        for horizon in self.horizons:
+            columns[f"fwd_{horizon}"] = self.forward_returns[horizon][start_row:end_row]
+
+        factor_values = data_manager.get_feature_data().slice(start_row, end_row - start_row).select(
+            [pl.col(factor).cast(pl.Float64).fill_nan(None) for factor in factors]
+        )
+        frame = pl.concat([pl.DataFrame(columns), factor_values], how="horizontal").with_columns(
+            [pl.col(f"fwd_{horizon}").fill_nan(None) for horizon in self.horizons]
+        )
+
+        if universe:
+            mask = np.unpackbits(data_manager._combine_universe(universe), count=data_manager.data.height).astype(bool)
+            frame = frame.filter(pl.Series(mask[start_row:end_row]))
+        return frame
+
+    @timed_stage("因子分析")
+    def analyze(self, factors, start_date=None, end_date=None, universe=None, quantiles=5):
+        """
+        批量分析因子
+
+        Args:
+            factors: 因子列名列表
+            start_date: 开始日期
+            end_date: 结束日期
+            universe: 选债范围规则（见 DataManager.get_universe_data），为None时使用全部数据
+            quantiles: 分位数组数
+
+        Returns:
+            list: 每个 (因子, 持有期) 一条结果，包含IC统计、各分位平均收益、多空收益和头部分位换手率
+        """
+        start_time = time.time()
+        frame = self._analysis_frame(factors, start_date, end_date, universe)
+
+        # 1. 每日Rank IC：所有因子 × 持有期在一次分组聚合中计算
+        ic_expressions = []
+        for factor in factors:
+            for horizon in self.horizons:
+                valid = pl.col(factor).is_not_null() & pl.col(f"fwd_{horizon}").is_not_null()
+                ic_expressions.append(
+                    pl.corr(
+                        pl.col(factor).filter(valid),
+                        pl.col(f"fwd_{horizon}").filter(valid),
+                        method="spearman",
+                    ).alias(f"{factor}|{horizon}")
+                )
+        daily_ic = frame.group_by("date_idx").agg(ic_expressions)
+
+        # 2. 分位分组：每日按因子值升序等分为 quantiles 组（0为因子值最小的一组）
+        bucket_frame = frame.with_columns([
+            (
+                (pl.col(factor).rank(method="ordinal") - 1) * quantiles
+                / pl.col(factor).count()
+            ).floor().over("date_idx").cast(pl.Int32).alias(f"bucket_{factor}")
+            for factor in factors
+        ])
+
+        results = []
+        for factor in factors:
+            bucket_col = f"bucket_{factor}"
+            factor_rows = bucket_frame.filter(pl.col(bucket_col).is_not_null())
+
+            # 各分位的日均未来收益率，再对交易日取平均
+            quantile_returns = (
+                factor_rows.group_by(["date_idx", bucket_col])
+                .agg([pl.col(f"fwd_{horizon}").mean() for horizon in self.horizons])
+                .group_by(bucket_col)
+                .agg([pl.col(f"fwd_{horizon}").mean() for horizon in self.horizons])
+                .sort(bucket_col)
+            )
+
+            turnover = self._top_bucket_turnover(factor_rows, bucket_col, quantiles)
+
+            for horizon in self.horizons:
+                ic = daily_ic.get_column(f"{factor}|{horizon}").drop_nulls().drop_nans().to_numpy()
+                ic_mean = float(np.mean(ic)) if len(ic) else None
+                ic_std = float(np.std(ic, ddof=1)) if len(ic) > 1 else None
+                bucket_returns = quantile_returns.get_column(f"fwd_{horizon}").to_list()
+
+                results.append({
+                    "factor": factor,
+                    "horizon": horizon,
+                    "ic_mean": ic_mean,
+                    "ic_std": ic_std,
+                    "ic_ir": ic_mean / ic_std if ic_std else None,
+                    "ic_t_stat": ic_mean / ic_std * np.sqrt(len(ic)) if ic_std else None,
+                    "ic_positive_ratio": float(np.mean(ic > 0)) if len(ic) else None,
+                    "ic_days": len(ic),
+                    "quantile_returns": bucket_returns,
+                    "long_short_return": (
+                        bucket_returns[-1] - bucket_returns[0]
+                        if len(bucket_returns) >= 2 and bucket_returns[-1] is not None and bucket_returns[0] is not None
+                        else None
+                    ),
+                    "top_quantile_turnover": turnover,
+                })
+
+        print(f"因子分析完成: {len(factors)} 个因子, {len(self.horizons)} 个持有期, 耗时 {time.time() - start_time:.2f}秒")
+        return results
+
+    def _top_bucket_turnover(self, factor_rows, bucket_col, quantiles):
+        """头部分位（因子值最大的一组）相邻交易日之间的平均换手率"""
+        top_rows = factor_rows.filter(pl.col(bucket_col) == quantiles - 1).select(["date_idx", "code_idx"])
+        if top_rows.is_empty():
+            return None
+
+        date_idx = top_rows.get_column("date_idx").to_numpy()
+        code_idx = top_rows.get_column("code_idx").to_numpy()
+        dates = np.unique(date_idx)
+        if len(dates) < 2:
+            return None
+
+        # 成员矩阵：分析区间内的交易日 × 转债代码
+        membership = np.zeros((len(dates), len(self.data_manager.codes)), dtype=bool)
+        membership[np.searchsorted(dates, date_idx), code_idx] = True
+
+        kept = (membership[1:] & membership[:-1]).sum(axis=1)
+        size = membership[1:].sum(axis=1)
+        valid = size > 0
+        return float(np.mean(1 - kept[valid] / size[valid])) if valid.any() else None
@@ -0,0 +1,175 @@
+import ast
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+import polars as pl
+
+
+# 逐元素函数：函数名 -> (参数个数, 构造表达式)
+ELEMENTWISE_FUNCTIONS = {
+    "log": (1, lambda x: x.log()),
+    "exp": (1, lambda x: x.exp()),
+    "abs": (1, lambda x: x.abs()),
+    "sqrt": (1, lambda x: x.sqrt()),
+    "clip": (3, lambda x, lower, upper: pl.when(x < lower).then(lower).when(x > upper).then(upper).otherwise(x)),
+    "min": (2, lambda a, b: pl.min_horizontal(a, b)),
+    "max": (2, lambda a, b: pl.max_horizontal(a, b)),
+}
+
+# 截面函数：按交易日分组计算
+CROSS_SECTIONAL_FUNCTIONS = {
+    "zscore": lambda x: ((x - x.mean()) / x.std()).over("trade_date"),
+    "rank": lambda x: x.rank().over("trade_date"),
+    "demean": lambda x: (x - x.mean()).over("trade_date"),
+}
+
+BINARY_OPERATORS = {
+    ast.Add: lambda left, right: left + right,
+    ast.Sub: lambda left, right: left - right,
+    ast.Mult: lambda left, right: left * right,
+    ast.Div: lambda left, right: left / right,
+    ast.Pow: lambda left, right: left.pow(right),
+}
+
+
+def _parse(expression):
+    try:
+        return ast.parse(expression.strip(), mode="eval").body
+    except SyntaxError as e:
+        raise ValueError(f"因子表达式语法错误: {expression} ({e.msg})")
+
+
+def normalize_expression(expression):
+    """因子表达式的规范化文本（统一空白和括号），作为缓存键"""
+    return ast.unparse(_parse(expression))
+
+
+def referenced_columns(expression):
+    """因子表达式中引用的全部列名（不包括函数名）"""
+    tree = _parse(expression)
+    function_names = {
+        id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)
+    }
+    names = [
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and id(node) not in function_names
+    ]
+    return list(dict.fromkeys(names))
+
+
+def _compile_node(node, expression):
+    """递归地将语法树节点编译为polars表达式"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return pl.lit(node.value)
+    if isinstance(node, ast.Name):
+        return pl.col(node.id)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        operand = _compile_node(node.operand, expression)
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        return BINARY_OPERATORS[type(node.op)](
+            _compile_node(node.left, expression), _compile_node(node.right, expression)
+        )
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name = node.func.id
+        args = [_compile_node(arg, expression) for arg in node.args]
+        if name in ELEMENTWISE_FUNCTIONS:
+            arg_count, build = ELEMENTWISE_FUNCTIONS[name]
+            if len(args) != arg_count:
+                raise ValueError(f"函数 {name} 需要 {arg_count} 个参数: {expression}")
+            return build(*args)
+        if name in CROSS_SECTIONAL_FUNCTIONS:
+            if len(args) != 1:
+                raise ValueError(f"函数 {name} 需要 1 个参数: {expression}")
+            return CROSS_SECTIONAL_FUNCTIONS[name](args[0])
+        raise ValueError(f"不支持的函数 {name}: {expression}")
+    raise ValueError(f"不支持的表达式语法 {ast.unparse(node)}: {expression}")
+
+
+@lru_cache(maxsize=256)
+def _compile_normalized(normalized):
+    # log/sqrt 负数、除以0、截面标准差为0等产生的NaN和无穷大记为空值，走“得分为空不参与选择”的规则，
+    # 避免 rank() 把NaN当作最大值
+    expr = _compile_node(_parse(normalized), normalized).cast(pl.Float64)
+    return pl.when(expr.is_finite()).then(expr).otherwise(None)
+
+
+def compile_factor(expression):
+    """
+    将因子表达式编译为polars表达式
+
+    支持:
+        - 列名、数值常量、+ - * / ** 运算
+        - 逐元素函数: log(x) exp(x) abs(x) sqrt(x) clip(x, 下限, 上限) min(a, b) max(a, b)
+        - 截面函数（按交易日分组）: zscore(x) rank(x) demean(x)
+    结果为Float64，NaN和无穷大记为空值。
+
+    示例:
+        "close + 1.5 * conv_prem"
+        "zscore(close) + zscore(conv_prem)"
+        "log(clip(remain_size, 0.1, 50))"
+
+    Raises:
+        ValueError: 语法错误或使用了不支持的函数/运算
+    """
+    return _compile_normalized(normalize_expression(expression))
+
+
+class DerivedFactorCache:
+    """派生因子计算结果缓存
+
+    截面函数（zscore/rank/demean）在选债范围内按交易日计算，因此按 (规范化表达式, 选债范围) 缓存
+    在该范围的全区间数据上计算出的列（与范围内的数据行对齐），
+    同一派生因子在多次回测和参数扫描之间只计算一次。超过容量时淘汰最久未使用的列。
+    """
+
+    def __init__(self, data_manager, max_entries=16):
+        self.data_manager = data_manager
+        self.max_entries = max_entries
+        self._columns = OrderedDict()  # {(规范化表达式, 选债范围): pl.Series}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, expression, frame, universe=None) -> pl.Series:
+        """
+        获取表达式在选债范围内的计算结果
+
+        Args:
+            expression: 因子表达式
+            frame: 选债范围内全部交易日的数据（未指定选债范围时为全量数据）
+            universe: 选债范围规则，作为缓存键的一部分
+        """
+        normalized = normalize_expression(expression)
+        key = (normalized, json.dumps(universe, sort_keys=True, ensure_ascii=False))
+        with self._lock:
+            if key in self._columns:
+                self._columns.move_to_end(key)
+                self.hits += 1
+                return self._columns[key]
+
+        series = frame.select(compile_factor(normalized).alias(normalized)).to_series()
+
+        with self._lock:
+            self.misses += 1
+            self._columns[key] = series
+            self._columns.move_to_end(key)
+            while len(self._columns) > self.max_entries:
+                self._columns.popitem(last=False)
+        return series
+
+    def get_columns(self, derived_factors, frame, universe=None):
+        """按 {因子名: 表达式} 获取命名后的列列表，参数同 get"""
+        existing = set(self.data_manager.data.columns) | set(self.data_manager.feature_data.columns)
+        columns = []
+        for name, expression in derived_factors.items():
+            if name in existing:
+                raise ValueError(f"派生因子名与已有列重名: {name}")
+            columns.append(self.get(expression, frame, universe).alias(name))
+        return columns
+
+    def clear(self):
+        """数据变化（如重新加载）后清空缓存"""
+        with self._lock:
+            self._columns.clear()
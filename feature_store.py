@@ -0,0 +1,204 @@
+import os
+import re
+import json
+import threading
+import numpy as np
+import polars as pl
+from tiktrack import timed_stage
+
+
+# 特征名称格式 -> 说明
+#   ret_{N}d      过去N个交易日收益率
+#   vol_{N}d      过去N个交易日日收益率的标准差
+#   turnover_{N}d 过去N个交易日平均换手率
+#   fwd_ret_{N}d  未来N个交易日收益率（含未来信息，仅用于因子分析，不应作为选债指标）
+FEATURE_PATTERN = re.compile(r"^(ret|vol|turnover|fwd_ret)_(\d+)d$")
+
+# 特征计算方式的版本，计算方式变化后已保存的特征自动失效
+FEATURE_VERSION = 2
+
+
+def is_feature_name(name):
+    """是否为特征库支持的特征名"""
+    return FEATURE_PATTERN.match(name) is not None
+
+
+def is_lookahead_feature(name):
+    """是否为包含未来信息的特征"""
+    return name.startswith("fwd_ret_") and is_feature_name(name)
+
+
+def parse_feature_name(name):
+    """解析特征名，返回 (类型, 窗口交易日数)"""
+    match = FEATURE_PATTERN.match(name)
+    if match is None:
+        raise ValueError(f"无效的特征名: {name}")
+    kind, window = match.group(1), int(match.group(2))
+    if window <= 0:
+        raise ValueError(f"特征窗口必须为正数: {name}")
+    return kind, window
+
+
+def _shift(matrix, periods):
+    """沿交易日方向平移矩阵（正数向后平移，即取 periods 个交易日之前的值），移出的位置为NaN"""
+    shifted = np.full_like(matrix, np.nan)
+    if 0 < periods < len(matrix):
+        shifted[periods:] = matrix[:-periods]
+    elif 0 < -periods < len(matrix):
+        shifted[:periods] = matrix[-periods:]
+    return shifted
+
+
+def _rolling_sums(matrix, window):
+    """窗口内的和、平方和及有效值个数（窗口结束于当日，共window个交易日）"""
+    valid = ~np.isnan(matrix)
+    values = np.where(valid, matrix, 0.0)
+    padding = np.zeros((1, matrix.shape[1]))
+    sums = np.cumsum(np.vstack([padding, values]), axis=0)
+    squares = np.cumsum(np.vstack([padding, values * values]), axis=0)
+    counts = np.cumsum(np.vstack([padding, valid.astype(float)]), axis=0)
+    window_sum = np.full_like(matrix, np.nan)
+    window_square = np.full_like(matrix, np.nan)
+    window_count = np.zeros_like(matrix)
+    if window <= len(matrix):
+        window_sum[window - 1:] = sums[window:] - sums[:-window]
+        window_square[window - 1:] = squares[window:] - squares[:-window]
+        window_count[window - 1:] = counts[window:] - counts[:-window]
+    return window_sum, window_square, window_count
+
+
+def feature_matrix(data_manager, name):
+    """特征在 (交易日 × 转债) 矩阵上的值
+
+    按交易日日历对齐计算：N日指标总是覆盖N个交易日。某只转债在窗口内有缺失交易日时，
+    收益率只取决于两端的收盘价，滚动波动率和滚动换手率因窗口不完整记为NaN
+    """
+    kind, window = parse_feature_name(name)
+
+    # 收盘价缺失时价格矩阵中记为0，视为无效价格
+    prices = np.where(data_manager.price_matrix > 0, data_manager.price_matrix, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if kind == "ret":
+            return prices / _shift(prices, window) - 1
+        if kind == "fwd_ret":
+            return _shift(prices, -window) / prices - 1
+        if kind == "vol":
+            matrix = prices / _shift(prices, 1) - 1
+        else:
+            row_date_idx, row_code_idx = data_manager.get_row_indices()
+            matrix = np.full(prices.shape, np.nan)
+            matrix[row_date_idx, row_code_idx] = (
+                data_manager.data.get_column("turnover").cast(pl.Float64).fill_null(np.nan).to_numpy()
+            )
+
+        window_sum, window_square, window_count = _rolling_sums(matrix, window)
+        complete = window_count == window
+        if kind == "turnover":
+            return np.where(complete, window_sum / window, np.nan)
+        if window < 2:
+            return np.full_like(matrix, np.nan)
+        variance = (window_square - window_sum * window_sum / window) / (window - 1)
+        return np.where(complete, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+
+
+def compute_features(data_manager, names):
+    """计算特征并按数据行展开，返回与数据行对齐的DataFrame（无效值为null）"""
+    row_date_idx, row_code_idx = data_manager.get_row_indices()
+    return pl.DataFrame([
+        pl.Series(name, feature_matrix(data_manager, name)[row_date_idx, row_code_idx]).fill_nan(None)
+        for name in names
+    ])
+
+
+class FeatureStore:
+    """转债时间序列特征库
+
+    按需在按交易日对齐的价格矩阵上计算每只转债的滚动特征（N日收益率、滚动波动率、滚动换手率、未来收益率），
+    计算结果存放在DataManager的特征表中，选债时与数据合并，可直接在配置的 indicators 中使用。
+    启用快照时特征保存在快照目录下，并记录数据源指纹，数据源变化后自动失效。
+    """
+
+    def __init__(self, data_manager):
+        self.data_manager = data_manager
+        self._lock = threading.Lock()
+
+    def _paths(self):
+        snapshot_dir = self.data_manager.snapshot_dir
+        return os.path.join(snapshot_dir, "features.arrow"), os.path.join(snapshot_dir, "features.json")
+
+    def _persist_enabled(self):
+        return self.data_manager.use_snapshot and self.data_manager.source_fingerprint
+
+    def _load_persisted(self, names):
+        """从快照目录读取已保存的特征，返回 (特征DataFrame或None, 已保存的特征名列表)"""
+        data_path, meta_path = self._paths()
+        if not (self._persist_enabled() and os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None, []
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get("source_hash") != self.data_manager.source_fingerprint or meta.get("version") != FEATURE_VERSION:
+                return None, []
+            # 不使用内存映射：读出的特征会长期保存在特征表中，映射的文件在Windows上无法被之后的保存替换
+            stored = pl.read_ipc(data_path, memory_map=False)
+            if stored.height != self.data_manager.data.height:
+                return None, []
+            return stored, stored.columns
+        except Exception as e:
+            print(f"读取特征缓存失败，将重新计算: {e}")
+            return None, []
+
+    def _persist(self, features):
+        """保存特征到快照目录"""
+        data_path, meta_path = self._paths()
+        try:
+            features.write_ipc(data_path + ".tmp", compression="uncompressed")
+            os.replace(data_path + ".tmp", data_path)
+            meta = {"source_hash": self.data_manager.source_fingerprint, "version": FEATURE_VERSION, "columns": features.columns}
+            with open(meta_path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_path + ".tmp", meta_path)
+        except Exception as e:
+            print(f"保存特征缓存失败: {e}")
+
+    @timed_stage("计算时间序列特征")
+    def ensure(self, names):
+        """确保所需特征已存在于特征表中
+
+        Args:
+            names: 列名列表，其中不是特征名的项会被忽略
+
+        Returns:
+            list: 本次新加入特征表的特征名
+        """
+        with self._lock:
+            data_manager = self.data_manager
+            missing = [
+                name for name in dict.fromkeys(names)
+                if is_feature_name(name) and name not in data_manager.feature_data.columns
+            ]
+            if not missing:
+                return []
+
+            stored, stored_columns = self._load_persisted(missing)
+            from_store = [name for name in missing if name in stored_columns]
+            to_compute = [name for name in missing if name not in stored_columns]
+
+            new_columns = []
+            if from_store:
+                new_columns.append(stored.select(from_store))
+            if to_compute:
+                print(f"计算时间序列特征: {to_compute}")
+                computed = compute_features(data_manager, to_compute)
+                new_columns.append(computed)
+
+                if self._persist_enabled():
+                    if stored is not None:
+                        combined = pl.concat([stored, computed], how="horizontal")
+                    else:
+                        combined = computed
+                    self._persist(combined)
+
+            data_manager._add_features(pl.concat(new_columns, how="horizontal"))
+            return missing
@@ -0,0 +1,145 @@
+import json
+from functools import lru_cache, reduce
+import polars as pl
+
+
+# 比较运算符
+COMPARISON_OPERATORS = {
+    ">": lambda left, right: left > right,
+    ">=": lambda left, right: left >= right,
+    "<": lambda left, right: left < right,
+    "<=": lambda left, right: left <= right,
+    "==": lambda left, right: left == right,
+    "=": lambda left, right: left == right,
+    "!=": lambda left, right: left != right,
+}
+
+# 逻辑组合关键字
+LOGICAL_KEYS = ("and", "or", "not")
+
+
+def _operand(value):
+    """条件右侧的值：{"col": "列名"} 表示与另一列比较，其余作为字面量"""
+    if isinstance(value, dict):
+        if set(value) != {"col"}:
+            raise ValueError(f"无效的列引用: {value}，应为 {{\"col\": \"列名\"}}")
+        return pl.col(value["col"])
+    return pl.lit(value)
+
+
+def _compile_condition(column, condition):
+    """编译单列条件，如 [">", 0.5]、["in", [...]]、["between", 1, 2]、["is_null"]"""
+    if not isinstance(condition, (list, tuple)) or not condition:
+        raise ValueError(f"无效的过滤条件: {column} -> {condition}")
+
+    operator, args = condition[0], list(condition[1:])
+    column_expr = pl.col(column)
+
+    if operator in COMPARISON_OPERATORS:
+        if len(args) != 1:
+            raise ValueError(f"运算符 {operator} 需要1个参数: {column} -> {condition}")
+        return COMPARISON_OPERATORS[operator](column_expr, _operand(args[0]))
+    if operator in ("in", "not_in"):
+        if len(args) != 1 or not isinstance(args[0], (list, tuple)):
+            raise ValueError(f"运算符 {operator} 需要一个取值列表: {column} -> {condition}")
+        expr = column_expr.is_in(list(args[0]))
+        return expr if operator == "in" else ~expr
+    if operator == "between":
+        if len(args) != 2:
+            raise ValueError(f"运算符 between 需要上下限2个参数: {column} -> {condition}")
+        return (column_expr >= _operand(args[0])) & (column_expr <= _operand(args[1]))
+    if operator == "is_null":
+        return column_expr.is_null()
+    if operator == "not_null":
+        return column_expr.is_not_null()
+
+    raise ValueError(f"不支持的过滤运算符: {operator}")
+
+
+def _combine_and(expressions):
+    """多个表达式取交集，为空时不过滤"""
+    if not expressions:
+        return pl.lit(True)
+    return reduce(lambda left, right: left & right, expressions)
+
+
+def _compile_spec(spec):
+    """递归编译过滤规则"""
+    # 列表：各项取交集
+    if isinstance(spec, list):
+        return _combine_and([_compile_spec(item) for item in spec])
+
+    if not isinstance(spec, dict):
+        raise ValueError(f"无效的过滤规则: {spec}")
+
+    expressions = []
+    for key, value in spec.items():
+        if key == "and":
+            expressions.append(_combine_and([_compile_spec(item) for item in value]))
+        elif key == "or":
+            if not value:
+                raise ValueError("or 条件不能为空")
+            expressions.append(reduce(lambda left, right: left | right, [_compile_spec(item) for item in value]))
+        elif key == "not":
+            expressions.append(~_compile_spec(value))
+        else:
+            # 普通的 {列名: 条件}
+            expressions.append(_compile_condition(key, value))
+    return _combine_and(expressions)
+
+
+def referenced_columns(spec):
+    """过滤规则中引用的全部列名（包括列间比较的右侧列）"""
+    columns = []
+    if isinstance(spec, list):
+        for item in spec:
+            columns.extend(referenced_columns(item))
+    elif isinstance(spec, dict):
+        for key, value in spec.items():
+            if key in ("and", "or"):
+                for item in value:
+                    columns.extend(referenced_columns(item))
+            elif key == "not":
+                columns.extend(referenced_columns(value))
+            else:
+                columns.append(key)
+                if isinstance(value, (list, tuple)):
+                    columns.extend(arg["col"] for arg in value[1:] if isinstance(arg, dict) and "col" in arg)
+    return list(dict.fromkeys(columns))
+
+
+def normalize_filters(spec):
+    """过滤规则的规范化文本，作为缓存键"""
+    return json.dumps(spec, sort_keys=True, ensure_ascii=False, default=str)
+
+
+@lru_cache(maxsize=256)
+def _compile_cached(normalized_spec):
+    return _compile_spec(json.loads(normalized_spec))
+
+
+def compile_filters(spec):
+    """
+    将过滤规则编译为单个polars表达式，一次过滤完成全部条件
+
+    规则格式:
+        - {"列名": [运算符, 参数...]}，多个列之间取交集（兼容原有的 filters 写法）
+        - 运算符: > >= < <= == = != in not_in between is_null not_null
+        - 与其他列比较: {"close": ["<", {"col": "conv_value"}]}
+        - 逻辑组合: {"and": [规则, ...]}, {"or": [规则, ...]}, {"not": 规则}
+
+    示例:
+        {"left_years": [">", 0.5], "or": [{"rating": ["in", ["AA", "AA+"]]}, {"close": ["<", 110]}]}
+
+    编译结果按规范化后的规则缓存，重复的回测和批量运行不会重复解析。
+
+    Args:
+        spec: 过滤规则（dict或list）
+
+    Returns:
+        pl.Expr: 布尔表达式
+
+    Raises:
+        ValueError: 规则格式无效或运算符不支持
+    """
+    return _compile_cached(normalize_filters(spec))
@@ -1,12 +1,200 @@
 import polars as pl
+import numpy as np
 import json
+import time
+from functools import reduce
 from datetime import datetime
+from filter_compiler import compile_filters
+
+
+# 内部排名列前缀，按方向区分，便于多个配置共享同一组排名
+RANK_PREFIX = "__rank_"
+
+# 选债结果中始终保留的列，其余列只保留排名用到的指标
+BASE_COLUMNS = ["trade_date", "code", "name"]
+
+
+def _parse_strategy_config(config):
+    """解析配置中与选债相关的参数"""
+    strategy_params = config.get("strategy_params", {})
+    return {
+        "start_date": config.get("start_date"),
+        "end_date": config.get("end_date"),
+        "top_n": config.get("top_n", 10),
+        "indicators": strategy_params.get("indicators", []),
+        "weights": strategy_params.get("weights", []),
+        "filters": strategy_params.get("filters", {}),
+        "universe": strategy_params.get("universe"),
+        "derived_factors": strategy_params.get("derived_factors"),
+    }
+
+
+def _rank_column_name(indicator, descending):
+    """内部排名列名"""
+    return f"{RANK_PREFIX}{'desc' if descending else 'asc'}_{indicator}"
+
+
+def _rank_specs(indicators, weights):
+    """配置所需的 (指标, 是否降序) 列表
+
+    负权重(-1)表示较小值更好，使用descending=True获取更高排名
+    正权重(1)表示较大值更好，使用descending=False获取更高排名
+    """
+    return [(indicator, weights[i] < 0) for i, indicator in enumerate(indicators)]
+
+
+def _output_columns(indicators):
+    """选债结果需要的原始列（投影下推用）"""
+    columns = list(BASE_COLUMNS)
+    for indicator in indicators:
+        if indicator not in columns:
+            columns.append(indicator)
+    return columns
+
+
+def universe_key(config):
+    """选债范围的键：日期区间、预定义范围、派生因子和前置过滤条件相同的配置可以共享过滤和排名结果"""
+    params = _parse_strategy_config(config)
+    return json.dumps(
+        [params["start_date"], params["end_date"], params["universe"], params["derived_factors"], params["filters"]],
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+
+
+def _universe_predicate(config):
+    """日期区间和前置过滤条件合并成的单个谓词，未指定任何条件时返回None"""
+    params = _parse_strategy_config(config)
+    predicates = []
+
+    # 1. 日期过滤
+    if params["start_date"]:
+        predicates.append(pl.col('trade_date') >= pl.lit(params["start_date"]).str.to_datetime())
+    if params["end_date"]:
+        predicates.append(pl.col('trade_date') <= pl.lit(params["end_date"]).str.to_datetime())
+
+    # 2. 前置过滤条件，编译为单个表达式
+    if params["filters"]:
+        predicates.append(compile_filters(params["filters"]))
+
+    if not predicates:
+        return None
+    return reduce(lambda left, right: left & right, predicates)
+
+
+def _to_lazy(df):
+    """DataFrame转为LazyFrame，已经是LazyFrame时原样返回"""
+    return df if isinstance(df, pl.LazyFrame) else df.lazy()
+
+
+def _column_names(frame):
+    """获取列名，LazyFrame通过schema获取以避免触发计算"""
+    if isinstance(frame, pl.LazyFrame):
+        return frame.collect_schema().names()
+    return frame.columns
+
+
+def build_universe_query(df, config, columns):
+    """构建选债范围的惰性查询：合并后的谓词一次过滤，只投影需要的列"""
+    query = _to_lazy(df)
+    predicate = _universe_predicate(config)
+    if predicate is not None:
+        query = query.filter(predicate)
+    return query.select(columns)
+
+
+def filter_universe(df, config):
+    """按日期区间和前置过滤条件筛选选债范围（保留全部列）"""
+    return build_universe_query(df, config, pl.all()).collect()
+
+
+def add_rank_columns(df, rank_specs):
+    """为选债范围添加按交易日分组的排名列
+
+    Args:
+        df: 已筛选的数据（DataFrame或LazyFrame，返回类型与输入一致）
+        rank_specs: (指标, 是否降序) 列表，重复项只计算一次
+    """
+    rank_expressions = []
+    seen = set()
+    for indicator, descending in rank_specs:
+        column_name = _rank_column_name(indicator, descending)
+        if column_name in seen:
+            continue
+        seen.add(column_name)
+        rank_expressions.append(
+            pl.col(indicator)
+                .rank(descending=descending)
+                .over('trade_date')
+                .alias(column_name)
+        )
+    return df.with_columns(rank_expressions)
+
+
+def _selection_position(score_column='score'):
+    """交易日内按 (得分降序, 代码升序) 的名次，得分相同时按代码决定先后，结果与输入行的顺序和数量无关"""
+    return (
+        pl.col(score_column).rank(method='min', descending=True).over('trade_date')
+        + pl.col('code').rank(method='ordinal').over(['trade_date', score_column])
+        - 1
+    )
+
+
+def select_top_n(ranked_df, indicators, weights, top_n):
+    """根据排名列计算综合得分，并获取每个交易日得分最高的前N条记录
+
+    按交易日分组取前N（组内排名过滤），不做全表排序；只对最终的小结果排序。
+    得分相同时按代码升序，选择结果和顺序不受输入数据范围（日期区间、窗口大小）影响。
+    输入为LazyFrame时返回LazyFrame。
+    """
+    # 计算综合得分 (权重绝对值 * 排名，然后相加)
+    score_expr = None
+    for indicator, weight in zip(indicators, weights):
+        term = pl.col(_rank_column_name(indicator, weight < 0)) * abs(weight)
+        score_expr = term if score_expr is None else score_expr + term
+
+    # 只保留本配置用到的排名列，并恢复为 rank_{indicator} 的命名
+    base_columns = [c for c in _column_names(ranked_df) if not c.startswith(RANK_PREFIX)]
+    rank_columns = [
+        pl.col(_rank_column_name(indicator, descending)).alias(f'rank_{indicator}')
+        for indicator, descending in _rank_specs(indicators, weights)
+    ]
+
+    # 由于我们的分数是根据排名计算的，分数越大表示综合排名越靠前；得分为空的记录不参与选择
+    return (
+        ranked_df
+        .select([pl.col(c) for c in base_columns] + rank_columns + [score_expr.alias('score')])
+        .filter(_selection_position() <= top_n)
+        .sort(['trade_date', 'score', 'code'], descending=[False, True, False])
+    )
+
+
+def build_top_bonds_query(df, config):
+    """
+    构建每日得分最高可转债的惰性查询计划
+
+    单个查询内完成：合并谓词过滤 -> 投影需要的列 -> 按日排名 -> 计算得分 -> 按日取前N
+
+    返回:
+    polars.LazyFrame: 可通过 .explain() 查看优化后的执行计划
+    """
+    params = _parse_strategy_config(config)
+    indicators = params["indicators"]
+    weights = params["weights"]
+
+    universe = build_universe_query(df, config, _output_columns(indicators))
+    ranked = add_rank_columns(universe, _rank_specs(indicators, weights))
+    return select_top_n(ranked, indicators, weights, params["top_n"])
+
+
+def explain_top_bonds_query(df, config, optimized=True):
+    """返回选债查询的执行计划文本"""
+    return build_top_bonds_query(df, config).explain(optimized=optimized)
 
 
 def get_top_bonds_by_score(df, config):
     """
     根据配置文件计算多因子排名，并获取每个交易日得分最高的可转债
-    
+
     参数:
     df (polars.DataFrame): 输入的数据框
     config (dict): 策略配置参数，包含以下关键字:
@@ -16,83 +204,282 @@ def get_top_bonds_by_score(df, config):
         - strategy_params (dict): 策略参数，包含:
             - indicators (list): 用于排名的指标列名列表
             - weights (list): 对应指标的权重列表 (-1表示负相关，1表示正相关)
-            - filters (dict): 前置筛选条件，如 {"left_years": [">", 0.5]}
-    
+            - filters (dict): 前置筛选条件，如 {"left_years": [">", 0.5]}，
+              支持and/or/not、in、between、is_null及列间比较，见 filter_compiler.compile_filters
+
     返回:
     polars.DataFrame: 包含每个交易日得分最高的N只可转债的DataFrame
+        (trade_date, code, name, 各指标, rank_各指标, score)
     """
-    # 解析配置参数
-    start_date = config.get("start_date")
-    end_date = config.get("end_date")
-    top_n = config.get("top_n", 10)
-    strategy_params = config.get("strategy_params", {})
-    indicators = strategy_params.get("indicators", [])
-    weights = strategy_params.get("weights", [])
-    filters = strategy_params.get("filters", {})
-     
-    # 1. 日期过滤
+    return build_top_bonds_query(df, config).collect()
+
+
+def get_top_bonds_for_configs(df, configs):
+    """
+    为多个配置批量计算每日得分最高的可转债
+
+    选债范围相同（日期区间和前置过滤条件一致）的配置共享一次过滤，
+    并一次性计算这些配置用到的全部排名列，之后每个配置只需计算得分和取前N，
+    组内各配置的查询通过 collect_all 并行执行。
+
+    参数:
+    df (polars.DataFrame | callable): 输入的数据框；也可以是 config -> DataFrame 的函数
+        （如 DataManager.get_selection_frame），每组选债范围只调用一次
+    configs (list): 策略配置列表，格式同 get_top_bonds_by_score
+
+    返回:
+    list: 与configs顺序一致的每日前N转债DataFrame列表
+    """
+    # 按选债范围分组
+    groups = {}
+    for i, config in enumerate(configs):
+        groups.setdefault(universe_key(config), []).append(i)
+
+    results = [None] * len(configs)
+    for indices in groups.values():
+        # 合并组内所有配置需要的列和排名
+        columns = list(BASE_COLUMNS)
+        rank_specs = []
+        for i in indices:
+            params = _parse_strategy_config(configs[i])
+            columns.extend(c for c in params["indicators"] if c not in columns)
+            rank_specs.extend(_rank_specs(params["indicators"], params["weights"]))
+
+        group_df = df(configs[indices[0]]) if callable(df) else df
+        universe = build_universe_query(group_df, configs[indices[0]], columns)
+        ranked_df = add_rank_columns(universe, rank_specs).collect()
+
+        queries = []
+        for i in indices:
+            params = _parse_strategy_config(configs[i])
+            queries.append(select_top_n(ranked_df.lazy(), params["indicators"], params["weights"], params["top_n"]))
+
+        for i, top_bonds in zip(indices, pl.collect_all(queries)):
+            results[i] = top_bonds
+
+    return results
+
+
+class MultiWeightSelection:
+    """多组权重的每日前N选债结果
+
+    Attributes:
+        frame: 选债范围内的数据（按交易日排序），indices中的行号均指向该DataFrame
+        dates: 交易日列表
+        indices: 形状为 (K, 交易日数, top_n) 的行号数组，按得分从高到低排列，不足top_n时以-1填充
+        scores: 与indices对应的得分，填充位置为NaN
+        weight_vectors: 形状为 (K, 指标数) 的权重矩阵
+    """
+
+    def __init__(self, frame, dates, indices, scores, weight_vectors):
+        self.frame = frame
+        self.dates = dates
+        self.indices = indices
+        self.scores = scores
+        self.weight_vectors = weight_vectors
+        self.date_positions = {date: i for i, date in enumerate(dates)}
+
+    def for_weights(self, k):
+        """第k组权重的选债结果视图，可直接传给 BaseStrategy.run_backtest(selection=...)"""
+        return WeightSelectionView(self, k)
+
+
+class WeightSelectionView:
+    """单组权重的选债结果，按日期直接取出当日前N行"""
+
+    def __init__(self, selection, k):
+        self.selection = selection
+        self.k = k
+
+    def get_top_bonds(self, date):
+        """获取指定交易日的前N转债（DataFrame），无数据时返回空表"""
+        selection = self.selection
+        position = selection.date_positions.get(date)
+        if position is None:
+            return selection.frame.head(0)
+        rows = selection.indices[self.k, position]
+        return selection.frame[rows[rows >= 0]]
+
+    def to_dataframe(self):
+        """展开为与 get_top_bonds_by_score 相同形式的长表"""
+        rows = self.selection.indices[self.k].ravel()
+        return self.selection.frame[rows[rows >= 0]]
+
+
+def _rank_matrix(ranked_df, indicators, descending):
+    """排名矩阵（行 × 指标），空值记为NaN"""
+    return np.column_stack([
+        ranked_df.get_column(_rank_column_name(indicator, descending)).cast(pl.Float64).fill_null(np.nan).to_numpy()
+        for indicator in indicators
+    ])
+
+
+def get_top_bonds_multi_weights(df, config, weight_vectors):
+    """
+    一次性计算K组权重的每日前N转债
+
+    排名矩阵（行 × 指标）只计算一次，K组得分通过矩阵乘法同时得到，
+    之后按交易日分段对所有权重同时排序取前N（得分相同时按代码升序，与 select_top_n 一致）。
+    适用于权重优化/参数扫描。
+
+    参数:
+    df (polars.DataFrame): 输入的数据框
+    config (dict): 策略配置，使用其中的日期区间、前置过滤条件、indicators 和 top_n（weights被忽略）
+    weight_vectors: 形状为 (K, 指标数) 的权重矩阵，每行的含义同 weights
+
+    返回:
+    MultiWeightSelection: 行号数组形状为 (K, 交易日数, top_n)
+    """
+    params = _parse_strategy_config(config)
+    indicators = params["indicators"]
+    top_n = params["top_n"]
+    weights = np.atleast_2d(np.asarray(weight_vectors, dtype=float))
+    if weights.shape[1] != len(indicators):
+        raise ValueError(f"权重向量长度 {weights.shape[1]} 与指标数量 {len(indicators)} 不一致")
+
+    # 1. 选债范围 + 正反两个方向的排名（只计算权重中实际出现的方向）
+    rank_specs = []
+    for j, indicator in enumerate(indicators):
+        if (weights[:, j] < 0).any():
+            rank_specs.append((indicator, True))
+        if (weights[:, j] >= 0).any():
+            rank_specs.append((indicator, False))
+    universe = build_universe_query(df, config, _output_columns(indicators))
+    ranked_df = add_rank_columns(universe, rank_specs).sort('trade_date', maintain_order=True).collect()
+
+    # 2. K组得分：score = 升序排名 @ 正权重 + 降序排名 @ |负权重|
+    positive = np.where(weights >= 0, weights, 0.0)
+    negative = np.where(weights < 0, -weights, 0.0)
+    scores = np.zeros((ranked_df.height, len(weights)))
+    has_null = np.zeros(ranked_df.height, dtype=bool)
+    for descending, direction_weights in ((False, positive), (True, negative)):
+        used = [j for j, indicator in enumerate(indicators) if (indicator, descending) in rank_specs]
+        if not used:
+            continue
+        ranks = _rank_matrix(ranked_df, [indicators[j] for j in used], descending)
+        is_null = np.isnan(ranks)
+        scores += np.where(is_null, 0.0, ranks) @ direction_weights[:, used].T
+        has_null |= is_null.any(axis=1)
+    # 与 select_top_n 一致：任一指标为空（即使权重为0）时得分为空，该行不参与选择
+    scores[has_null] = -np.inf
+
+    # 3. 按交易日分段，为K组权重同时取前N
+    date_values = ranked_df.get_column('trade_date')
+    boundaries = np.flatnonzero(np.diff(date_values.to_physical().to_numpy())) + 1
+    starts = np.concatenate([[0], boundaries]) if ranked_df.height else np.array([], dtype=np.int64)
+    ends = np.concatenate([boundaries, [ranked_df.height]]) if ranked_df.height else np.array([], dtype=np.int64)
+    dates = date_values.gather(starts).to_list() if ranked_df.height else []
+    # 代码的排序键，与 select_top_n 中 code 列的排序一致
+    code_keys = ranked_df.get_column('code').rank(method='dense').to_numpy() if ranked_df.height else np.array([])
+
+    indices = np.full((len(weights), len(dates), top_n), -1, dtype=np.int64)
+    top_scores = np.full(indices.shape, np.nan)
+    for d, (start, end) in enumerate(zip(starts, ends)):
+        block = scores[start:end]
+        count = min(top_n, end - start)
+        # 按 (得分降序, 代码升序) 对每组权重排序，最后一个键为主键
+        block_codes = np.broadcast_to(code_keys[start:end, None], block.shape)
+        candidates = np.lexsort((block_codes, -block), axis=0)[:top_n]
+        candidate_scores = np.take_along_axis(block, candidates, axis=0)
+        finite = np.isfinite(candidate_scores)
+        indices[:, d, :count] = np.where(finite, candidates + start, -1)[:count].T
+        top_scores[:, d, :count] = np.where(finite, candidate_scores, np.nan)[:count].T
+
+    frame = ranked_df.select([c for c in ranked_df.columns if not c.startswith(RANK_PREFIX)])
+    return MultiWeightSelection(frame, dates, indices, top_scores, weights)
+
+
+def check_multi_weight_parity(df, config, selection):
+    """
+    与 get_top_bonds_by_score 逐组权重对照多组权重选债结果
+
+    两种实现使用相同的同分规则（按代码升序），按交易日逐个比较入选转债的代码和顺序
+
+    返回:
+    dict: {权重组序号: 不一致的交易日列表}，全部一致时为空字典
+    """
+    mismatches = {}
+    for k, weight_vector in enumerate(selection.weight_vectors):
+        weight_config = dict(config)
+        weight_config["strategy_params"] = {**config.get("strategy_params", {}), "weights": weight_vector.tolist()}
+        reference = (
+            get_top_bonds_by_score(df, weight_config)
+            .group_by("trade_date", maintain_order=True)
+            .agg(pl.col("code"))
+        )
+        expected = dict(zip(reference.get_column("trade_date").to_list(), reference.get_column("code").to_list()))
+
+        codes = selection.frame.get_column("code")
+        bad_dates = []
+        for d, date in enumerate(selection.dates):
+            rows = selection.indices[k, d]
+            actual = codes.gather(rows[rows >= 0]).to_list()
+            if actual != expected.get(date, []):
+                bad_dates.append(date)
+        bad_dates.extend(date for date in expected if date not in selection.date_positions and expected[date])
+        if bad_dates:
+            mismatches[k] = bad_dates
+    return mismatches
+
+
+def get_top_bonds_by_score_eager(df, config):
+    """逐步物化的旧版实现，仅作为惰性查询的基准对照
+
+    选择规则与惰性查询相同：得分为空的记录不参与选择，得分相同时按代码升序
+    """
+    params = _parse_strategy_config(config)
+    indicators = params["indicators"]
+    weights = params["weights"]
+
     filtered_df = df
-    filtered_df = filtered_df.filter(
-        pl.col('trade_date') >= pl.lit(start_date).str.to_datetime()
+    if params["start_date"]:
+        filtered_df = filtered_df.filter(pl.col('trade_date') >= pl.lit(params["start_date"]).str.to_datetime())
+    if params["end_date"]:
+        filtered_df = filtered_df.filter(pl.col('trade_date') <= pl.lit(params["end_date"]).str.to_datetime())
+    if params["filters"]:
+        filtered_df = filtered_df.filter(compile_filters(params["filters"]))
+
+    ranked_df = filtered_df.with_columns([
+        pl.col(indicator).rank(descending=descending).over('trade_date').alias(f'rank_{indicator}')
+        for indicator, descending in _rank_specs(indicators, weights)
+    ])
+    score_expr = reduce(
+        lambda left, right: left + right,
+        [pl.col(f'rank_{indicator}') * abs(weight) for indicator, weight in zip(indicators, weights)]
     )
-    filtered_df = filtered_df.filter(
-        pl.col('trade_date') <= pl.lit(end_date).str.to_datetime()
+    ranked_df = ranked_df.with_columns([score_expr.alias('score')]).filter(pl.col('score').is_not_null())
+    return (
+        ranked_df
+        .sort(['trade_date', 'score', 'code'], descending=[False, True, False])
+        .group_by('trade_date', maintain_order=True)
+        .head(params["top_n"])
     )
-    
-    # 2. 应用前置过滤条件
-    for column, condition in filters.items():
-        operator, value = condition
-        if operator == ">":
-            filtered_df = filtered_df.filter(pl.col(column) > value)
-        elif operator == ">=":
-            filtered_df = filtered_df.filter(pl.col(column) >= value)
-        elif operator == "<":
-            filtered_df = filtered_df.filter(pl.col(column) < value)
-        elif operator == "<=":
-            filtered_df = filtered_df.filter(pl.col(column) <= value)
-        elif operator == "==":
-            filtered_df = filtered_df.filter(pl.col(column) == value)
-        elif operator == "!=":
-            filtered_df = filtered_df.filter(pl.col(column) != value)
-    
-    # 3. 计算各个指标的排名
-    rank_expressions = []
-    for i, indicator in enumerate(indicators):        
-        # 根据权重确定排序方向
-        # 负权重(-1)表示较小值更好，使用descending=True获取更高排名
-        # 正权重(1)表示较大值更好，使用descending=False获取更高排名
-        weight = weights[i]
-        descending = weight < 0
-        
-        rank_expr = (
-            pl.col(indicator)
-                .rank(descending=descending)
-                .over('trade_date')
-                .alias(f'rank_{indicator}')
-        )
-        rank_expressions.append(rank_expr)
-    
-    # 4. 添加排名列
-    ranked_df = filtered_df.with_columns(rank_expressions)
-    
-    # 5. 计算综合得分 (权重绝对值 * 排名，然后相加)
-    score_expr = None
-    for i, indicator in enumerate(indicators):
-        weight_abs = abs(weights[i])
-        if score_expr is None:
-            score_expr = (pl.col(f'rank_{indicator}') * weight_abs)
-        else:
-            score_expr = score_expr + (pl.col(f'rank_{indicator}') * weight_abs)
-    
-    ranked_df = ranked_df.with_columns([
-        score_expr.alias('score')
-    ])
-    
-    # 6. 根据分组获取每个日期得分最高的前N条记录
-    # 由于我们的分数是根据排名计算的，分数越小表示综合排名越靠前
-    top_n_df = ranked_df.sort(['trade_date', 'score'], descending=[False, True]).group_by('trade_date').head(top_n)
-    
-    return top_n_df
+
+
+def benchmark_top_bonds(df, config, repeat=3):
+    """对比逐步物化实现与惰性查询实现的耗时，并确认两者选出的转债和顺序一致
+
+    返回:
+    dict: 两种实现的最短耗时(秒)和加速比
+    """
+    timings = {}
+    outputs = {}
+    for label, func in (("eager", get_top_bonds_by_score_eager), ("lazy", get_top_bonds_by_score)):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[label] = func(df, config)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best
+
+    compared = ['trade_date', 'code', 'score']
+    eager = outputs["eager"].select(compared).with_columns(pl.col('score').cast(pl.Float64))
+    lazy = outputs["lazy"].select(compared).with_columns(pl.col('score').cast(pl.Float64))
+    if not eager.equals(lazy):
+        raise AssertionError("逐步物化实现与惰性查询实现的选债结果不一致")
+    timings["speedup"] = timings["eager"] / timings["lazy"] if timings["lazy"] > 0 else None
+    return timings
 
 
 # 示例用法
@@ -115,8 +502,12 @@ if __name__ == "__main__":
             }
         }
     }
-    
-    # 假设df是已经加载的polars DataFrame
-    # df = pl.read_parquet("cb_data.pq")
-    # top10_df = get_top_bonds_by_score(df, config)
-    # print(top10_df)
\ No newline at end of file
+
+    df = pl.read_parquet(config["data_path"]).with_columns(pl.col("trade_date").cast(pl.Datetime))
+
+    # 查看优化后的执行计划
+    print(explain_top_bonds_query(df, config))
+
+    # 与逐步物化的实现对比耗时
+    timings = benchmark_top_bonds(df, config)
+    print(f"逐步物化: {timings['eager']:.3f}秒, 惰性查询: {timings['lazy']:.3f}秒, 加速比: {timings['speedup']:.2f}x")
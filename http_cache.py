@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+
+# 历史日期的数据在数据集重新加载前不会变化，允许浏览器和反向代理缓存一天
+HISTORICAL_CACHE_CONTROL = "public, max-age=86400"
+# 最新日期（或不带日期）的响应每次都需要用ETag重新验证
+LATEST_CACHE_CONTROL = "public, no-cache"
+
+
+class ResponseCache:
+    """响应体LRU及命中统计，由 HttpCacheMiddleware 使用，可在指标接口中读取统计"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()  # {请求键: (响应体, media_type, etag)}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            cached = self._bodies.get(key)
+            if cached is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+            return cached
+
+    def put(self, key, entry):
+        with self._lock:
+            self.misses += 1
+            self._bodies[key] = entry
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def stats(self):
+        """缓存命中统计"""
+        with self._lock:
+            entries = len(self._bodies)
+        return {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified, "entries": entries}
+
+
+def content_etag(body):
+    """由响应体内容计算的弱ETag"""
+    return f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+class HttpCacheMiddleware(BaseHTTPMiddleware):
+    """市场数据接口的HTTP缓存
+
+    - ETag 由响应体内容计算，内容变化时ETag一定变化
+    - 响应体按 数据集版本（源文件指纹 + 列结构）+ 路径 + 规范化后的查询参数 保存在LRU中，
+      重复请求不再重新计算和序列化；请求头 If-None-Match 与缓存的ETag相同时直接返回304
+    - 查询历史日期时返回长期有效的 Cache-Control，最新日期要求重新验证
+    压缩由外层的压缩中间件处理，这里缓存的是未压缩的响应体，因此使用弱ETag。
+    """
+
+    def __init__(self, app, paths, get_version, get_latest_date, cache=None):
+        """
+        Args:
+            app: ASGI应用
+            paths: 启用缓存的GET接口路径
+            get_version: 返回当前数据集版本字符串的函数
+            get_latest_date: 返回最新交易日的函数
+            cache: 响应体缓存（ResponseCache），默认新建
+        """
+        super().__init__(app)
+        self.paths = set(paths)
+        self.get_version = get_version
+        self.get_latest_date = get_latest_date
+        self.cache = cache if cache is not None else ResponseCache()
+
+    def _cache_key(self, request):
+        query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+        return f"{self.get_version()}|{request.url.path}|{query}"
+
+    def _cache_control(self, request):
+        """查询日期早于最新交易日时为历史数据"""
+        date = request.query_params.get("date")
+        if not date:
+            return LATEST_CACHE_CONTROL
+        try:
+            query_date = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            return LATEST_CACHE_CONTROL
+        return HISTORICAL_CACHE_CONTROL if query_date < self.get_latest_date() else LATEST_CACHE_CONTROL
+
+    @staticmethod
+    def _matches(if_none_match, etag):
+        """If-None-Match 中的任一ETag与当前ETag相同（按弱比较）"""
+        opaque = etag[2:]
+        return any(
+            candidate.strip() in ("*", etag, opaque) or candidate.strip()[2:] == opaque
+            for candidate in if_none_match.split(",")
+        )
+
+    async def dispatch(self, request, call_next):
+        if request.method != "GET" or request.url.path not in self.paths:
+            return await call_next(request)
+
+        key = self._cache_key(request)
+        cached = self.cache.get(key)
+        if cached is None:
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            cached = (body, response.headers.get("content-type", "application/json"), content_etag(body))
+            self.cache.put(key, cached)
+
+        body, media_type, etag = cached
+        headers = {"ETag": etag, "Cache-Control": self._cache_control(request)}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and self._matches(if_none_match, etag):
+            self.cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=media_type, headers=headers)
+
+
+def latest_trading_date(data_manager):
+    """数据集中的最新交易日"""
+    dates = data_manager.trading_dates
+    return dates[-1] if dates else datetime.max
+
+
+def dataset_version(data_manager, fallback):
+    """数据集版本：源文件指纹（未计算指纹时如未启用快照，使用加载时间）加上数据的列结构"""
+    schema = hashlib.blake2b(repr(list(data_manager.data.schema.items())).encode("utf-8"), digest_size=6).hexdigest()
+    return f"{data_manager.source_fingerprint or fallback}:{schema}"
@@ -1,4 +1,4 @@
-from data_manager import DataManager
+from data_manager import DataManager, StreamingDataManager
 from create_strategy import create_strategy
 
 def main():
@@ -6,9 +6,12 @@ def main():
     strategy, config = create_strategy()
     data_path = config.get('data_path', 'data/cb_data.pq')
     
-    # 初始化数据
+    # 初始化数据，配置 streaming=true 时按日期窗口流式读取，不将全量数据载入内存
     print(f"正在加载数据: {data_path}")
-    data_manager = DataManager(data_path)
+    if config.get('streaming'):
+        data_manager = StreamingDataManager(data_path, window_days=config.get('stream_window_days', 60))
+    else:
+        data_manager = DataManager(data_path)
     
     # 运行回测
     print(f"正在使用策略: {config.get('strategy_type', 'default')}")
@@ -0,0 +1,252 @@
+import time
+import asyncio
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import numpy as np
+import polars as pl
+
+
+# 推送的行情字段
+STREAM_FIELDS = ("close", "pct_chg", "conv_prem", "ytm")
+
+
+class MarketReplay:
+    """增量编码的行情推送（用历史数据按交易日回放，模拟实时行情源）
+
+    消息通过广播中心的 market_delta 主题发布，data 字段有两种：
+    - 关键帧 {"type": "keyframe", "frame", "date", "fields", "codes", "present", "values"}：
+      codes 为槽位表（每个槽位都给出代码），present 为各槽位当日是否有数据（0/1），
+      values 为与槽位对齐的字段值（无数据的槽位为 null）
+    - 增量帧 {"type": "delta", "frame", "date", "added", "added_from", "returned", "removed", "changes"}：
+      added 为新增转债代码（依次占用从 added_from 开始的槽位），returned 为停牌等原因缺席后重新出现的槽位，
+      removed 为当日不再出现的槽位，changes 中每项为 [槽位, 字段位掩码, 变化的字段值...]，
+      第 i 个字段变化时掩码第 i 位为1（新增和重新出现的槽位发送全部字段）
+    数值先按 decimals 取整再比较，消息大小只与变化的字段数有关，与转债数量无关。
+    frame 逐帧加一，客户端发现跳号（如慢连接丢弃了消息）时可请求当前关键帧重新同步。
+    """
+
+    def __init__(self, data_manager, hub, fields=STREAM_FIELDS, decimals=4, keyframe_every=60):
+        """
+        Args:
+            data_manager: 数据管理器
+            hub: 广播中心
+            fields: 推送的字段
+            decimals: 数值保留的小数位数
+            keyframe_every: 每隔多少帧发布一次关键帧（同时压缩槽位表），0表示只在开始时发布
+        """
+        self.data_manager = data_manager
+        self.hub = hub
+        self.fields = tuple(fields)
+        self.decimals = decimals
+        self.keyframe_every = keyframe_every
+
+        self._task = None
+        self.interval = 1.0
+        self.loop = False
+        self.start_date = None
+        self.end_date = None
+        self.frame = 0
+        self.keyframes = 0
+        self.changed_values = 0
+        self.total_values = 0
+        self._reset_state()
+
+    def _reset_state(self):
+        self._codes = []  # 槽位 -> 代码
+        self._slot_of = {}  # 代码 -> 槽位
+        self._values = np.empty((0, len(self.fields)))
+        self._present = np.zeros(0, dtype=bool)
+        self._frames_since_keyframe = None  # None 表示下一帧必须是关键帧
+        self._snapshot = None  # (帧号, 已序列化的关键帧)
+        self.date = None
+
+    def _load_day(self, date):
+        """当日的代码列表和字段值矩阵（按精度取整，缺失值为NaN）"""
+        daily_data = self.data_manager.get_daily_data(date)
+        codes = daily_data.get_column("code").cast(pl.Utf8).to_list()
+        values = daily_data.select([pl.col(field).cast(pl.Float64) for field in self.fields]).to_numpy()
+        return codes, np.round(values, self.decimals)
+
+    @staticmethod
+    def _json_rows(values):
+        return [[None if value != value else value for value in row] for row in values.tolist()]
+
+    def _apply(self, codes, values):
+        """用当日数据更新槽位状态，返回增量帧内容和变化的字段数"""
+        field_count = len(self.fields)
+        added_from = len(self._codes)
+        added = [code for code in codes if code not in self._slot_of]
+        if added:
+            for offset, code in enumerate(added):
+                self._slot_of[code] = added_from + offset
+            self._codes.extend(added)
+            self._values = np.vstack([self._values, np.full((len(added), field_count), np.nan)])
+            self._present = np.concatenate([self._present, np.zeros(len(added), dtype=bool)])
+
+        slots = np.fromiter((self._slot_of[code] for code in codes), dtype=np.int64, count=len(codes))
+        previous = self._values[slots]
+        changed = ~((previous == values) | (np.isnan(previous) & np.isnan(values)))
+        # 新出现（或重新出现）的转债发送全部字段
+        absent = ~self._present[slots]
+        changed[absent] = True
+        returned = slots[absent]
+        returned = returned[returned < added_from]
+        masks = changed.astype(np.int64) @ (1 << np.arange(field_count, dtype=np.int64))
+
+        today = np.zeros(len(self._codes), dtype=bool)
+        today[slots] = True
+        removed = np.flatnonzero(self._present & ~today)
+
+        self._values[slots] = values
+        self._values[removed] = np.nan
+        self._present = today
+
+        changes = []
+        for row in np.flatnonzero(masks):
+            entry = [int(slots[row]), int(masks[row])]
+            entry.extend(None if value != value else value for value in values[row][changed[row]].tolist())
+            changes.append(entry)
+
+        delta = {
+            "type": "delta",
+            "added": added,
+            "added_from": added_from,
+            "returned": returned.tolist(),
+            "removed": removed.tolist(),
+            "changes": changes,
+        }
+        return delta, int(changed.sum())
+
+    def _keyframe(self, compact):
+        """由当前状态生成关键帧；compact 时先去掉已退市的槽位（仅用于向全部订阅者发布的关键帧）"""
+        if compact:
+            keep = np.flatnonzero(self._present)
+            self._codes = [self._codes[i] for i in keep]
+            self._slot_of = {code: slot for slot, code in enumerate(self._codes)}
+            self._values = self._values[keep]
+            self._present = np.ones(len(keep), dtype=bool)
+        return {
+            "type": "keyframe",
+            "frame": self.frame,
+            "date": self.date.strftime("%Y-%m-%d"),
+            "fields": list(self.fields),
+            "codes": list(self._codes),
+            "present": self._present.astype(int).tolist(),
+            "values": self._json_rows(self._values),
+        }
+
+    def step(self, date):
+        """推送一个交易日：必要时发布关键帧，否则发布增量帧"""
+        codes, values = self._load_day(date)
+        delta, changed = self._apply(codes, values)
+        self.date = date
+        self.frame += 1
+        self._snapshot = None
+        self.changed_values += changed
+        self.total_values += values.size
+
+        if self._frames_since_keyframe is None or (
+            self.keyframe_every and self._frames_since_keyframe + 1 >= self.keyframe_every
+        ):
+            message = self._keyframe(compact=True)
+            self._frames_since_keyframe = 0
+            self.keyframes += 1
+        else:
+            message = {**delta, "frame": self.frame, "date": date.strftime("%Y-%m-%d")}
+            self._frames_since_keyframe += 1
+
+        self.hub.publish("market_delta", message)
+        self.hub.publish("data_update", {"date": date.strftime("%Y-%m-%d"), "bonds": len(codes)},
+                         coalesce_key="market_date")
+
+    def send_snapshot(self, connection):
+        """向单个连接发送当前关键帧（新订阅或重新同步时），同一帧只序列化一次"""
+        if self.date is None:
+            return False
+        if self._snapshot is None or self._snapshot[0] != self.frame:
+            text = self.hub.encode({"topic": "market_delta", "seq": None, "data": self._keyframe(compact=False)})
+            self._snapshot = (self.frame, text)
+        connection.offer(self._snapshot[1])
+        return True
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, start_date=None, end_date=None, interval=1.0, loop=False):
+        """
+        开始回放（需在事件循环中调用），已在回放时先停止
+
+        Args:
+            start_date: 开始日期（YYYY-MM-DD），默认第一个交易日
+            end_date: 结束日期（YYYY-MM-DD），默认最后一个交易日
+            interval: 每个交易日间隔的秒数
+            loop: 回放结束后是否从头循环
+
+        Raises:
+            ValueError: 日期格式无效、间隔不为正数或区间内没有交易日
+        """
+        if interval is None or interval <= 0:
+            raise ValueError("interval 必须为正数")
+        try:
+            start = datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+            end = datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
+        except ValueError:
+            raise ValueError("日期格式无效，请使用YYYY-MM-DD格式")
+
+        trading_dates = self.data_manager.trading_dates
+        start_idx = bisect_left(trading_dates, start) if start else 0
+        end_idx = bisect_right(trading_dates, end) if end else len(trading_dates)
+        dates = trading_dates[start_idx:end_idx]
+        if not dates:
+            raise ValueError("所选区间内没有交易日")
+
+        self.stop()
+        self.interval = interval
+        self.loop = loop
+        self.start_date = dates[0]
+        self.end_date = dates[-1]
+        self.frame = 0
+        self.keyframes = 0
+        self.changed_values = 0
+        self.total_values = 0
+        self._reset_state()
+        self._task = asyncio.ensure_future(self._run(dates))
+        self._task.add_done_callback(self._on_done)
+
+    @staticmethod
+    def _on_done(task):
+        """回放任务异常结束时输出错误"""
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print(f"行情回放异常终止: {type(error).__name__}: {error}")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, dates):
+        while True:
+            for date in dates:
+                started = time.time()
+                self.step(date)
+                await asyncio.sleep(max(0.0, self.interval - (time.time() - started)))
+            if not self.loop:
+                break
+            # 从头循环时重新发布关键帧
+            self._reset_state()
+
+    def stats(self):
+        """回放状态和增量压缩率"""
+        return {
+            "running": self.running,
+            "date": self.date.strftime("%Y-%m-%d") if self.date else None,
+            "start_date": self.start_date.strftime("%Y-%m-%d") if self.start_date else None,
+            "end_date": self.end_date.strftime("%Y-%m-%d") if self.end_date else None,
+            "interval": self.interval,
+            "loop": self.loop,
+            "frame": self.frame,
+            "keyframes": self.keyframes,
+            "changed_ratio": self.changed_values / self.total_values if self.total_values else 0.0,
+        }
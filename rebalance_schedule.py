@@ -0,0 +1,54 @@
+from bisect import bisect_left
+from datetime import datetime
+import numpy as np
+
+
+def rebalance_flags(dates, schedule="daily"):
+    """
+    计算每个交易日是否为调仓日
+
+    Args:
+        dates: 回测区间内按先后排列的交易日列表
+        schedule: 调仓频率
+            - "daily": 每个交易日（默认）
+            - "weekly": 每周第一个交易日
+            - "monthly": 每月第一个交易日
+            - {"every_n": N}: 从首个交易日起每N个交易日
+            - 日期列表（datetime或 YYYY-MM-DD 字符串）: 指定日期，非交易日顺延到其后第一个交易日
+
+    Returns:
+        np.ndarray: 与 dates 对齐的布尔数组
+
+    Raises:
+        ValueError: 调仓频率无效
+    """
+    count = len(dates)
+    if schedule is None or schedule == "daily":
+        return np.ones(count, dtype=bool)
+
+    if schedule in ("weekly", "monthly"):
+        if schedule == "weekly":
+            periods = [tuple(date.isocalendar())[:2] for date in dates]
+        else:
+            periods = [(date.year, date.month) for date in dates]
+        return np.array([i == 0 or periods[i] != periods[i - 1] for i in range(count)], dtype=bool)
+
+    if isinstance(schedule, dict) and set(schedule) == {"every_n"}:
+        interval = int(schedule["every_n"])
+        if interval < 1:
+            raise ValueError(f"every_n 必须为正整数: {schedule}")
+        return np.arange(count) % interval == 0
+
+    if isinstance(schedule, (list, tuple)):
+        flags = np.zeros(count, dtype=bool)
+        for target in schedule:
+            if isinstance(target, str):
+                target = datetime.fromisoformat(target)
+            position = bisect_left(dates, target)
+            if position < count:
+                flags[position] = True
+        return flags
+
+    raise ValueError(
+        f"无效的调仓频率: {schedule}。可选 daily / weekly / monthly / {{\"every_n\": N}} / 日期列表"
+    )
@@ -11,6 +11,7 @@ import time
 from data_manager import DataManager
 from create_strategy import create_strategy
 from after_backtest_report import generate_backtest_reports
+from robustness import block_bootstrap, flatten_intervals
 
 def run_batch_backtest():
     """批量运行回测"""
@@ -42,6 +43,8 @@ def run_batch_backtest():
                 strategy.run_backtest(data_manager, processed_config)
                 result = strategy.analyze_results()
                 result.update(config['factor_info'])
+                # 块自助法置信区间，衡量单条净值路径上绩效指标的稳健性
+                result.update(flatten_intervals(block_bootstrap(strategy.portfolio_values, seed=0)))
                 results.append(result)
                 
                 # 生成报告
@@ -0,0 +1,110 @@
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+import polars as pl
+from filter_compiler import compile_filters, normalize_filters, referenced_columns
+
+
+class BondScreener:
+    """转债筛选器
+
+    在DataManager缓存的每日数据切片上，用编译后的过滤表达式一次完成筛选、排序和列投影，
+    只序列化当前页。筛选排序后的结果按 (交易日, 规范化查询) 保存在LRU缓存中，
+    翻页和重复查询不需要重新计算。
+    """
+
+    def __init__(self, data_manager, max_entries=64):
+        self.data_manager = data_manager
+        self.max_entries = max_entries
+        self._results = OrderedDict()  # {(交易日, 查询): pl.DataFrame}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve_date(self, date=None):
+        """查询日期对应的交易日：为空时取最新交易日，非交易日取之前最近的交易日"""
+        trading_dates = self.data_manager.trading_dates
+        if not trading_dates:
+            raise ValueError("没有可用的交易日期")
+        if date is None:
+            return trading_dates[-1]
+        if isinstance(date, str):
+            try:
+                date = datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"日期格式无效: {date}，请使用YYYY-MM-DD格式")
+        position = bisect_right(trading_dates, date)
+        return trading_dates[max(position - 1, 0)]
+
+    def _compute(self, trade_date, filters, sort, columns):
+        """筛选、排序并投影一个交易日的数据"""
+        daily_data = self.data_manager.get_daily_data(trade_date)
+        available = set(daily_data.columns)
+
+        referenced = list(columns or []) + [key["column"] for key in sort] + referenced_columns(filters or {})
+        missing = [col for col in referenced if col not in available]
+        if missing:
+            raise ValueError(f"数据中不存在的列: {missing}")
+
+        query = daily_data.lazy()
+        if filters:
+            query = query.filter(compile_filters(filters).fill_null(False))
+        if sort:
+            query = query.sort(
+                [key["column"] for key in sort],
+                descending=[bool(key.get("descending", False)) for key in sort],
+                nulls_last=True,
+            )
+        if columns:
+            query = query.select(list(dict.fromkeys(["code", "name"] + list(columns))))
+        return query.with_columns([
+            pl.col(pl.Float32, pl.Float64).fill_nan(None),
+            pl.col(pl.Datetime, pl.Date).dt.strftime("%Y-%m-%d"),
+        ]).collect()
+
+    def screen(self, date=None, filters=None, sort=None, columns=None, page=1, page_size=50):
+        """
+        筛选转债
+
+        Args:
+            date: 交易日（YYYY-MM-DD），默认最新交易日
+            filters: 过滤规则，格式同 strategy_params.filters（见 compile_filters）
+            sort: 排序键列表，如 [{"column": "dblow", "descending": false}]
+            columns: 返回的列，默认全部列（code、name 总是包含）
+            page: 页码，从1开始
+            page_size: 每页条数
+
+        Returns:
+            dict: date、total（筛选后的总数）、page、page_size、items
+
+        Raises:
+            ValueError: 日期、过滤规则、列名或分页参数无效
+        """
+        if page < 1 or page_size < 1:
+            raise ValueError("page 和 page_size 必须为正整数")
+        sort = [dict(key) for key in (sort or [])]
+        trade_date = self.resolve_date(date)
+        key = (trade_date, normalize_filters({"filters": filters, "sort": sort, "columns": columns}))
+
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.hits += 1
+
+        if result is None:
+            result = self._compute(trade_date, filters, sort, columns)
+            with self._lock:
+                self.misses += 1
+                self._results[key] = result
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+
+        return {
+            "date": trade_date.strftime("%Y-%m-%d"),
+            "total": result.height,
+            "page": page,
+            "page_size": page_size,
+            "items": result.slice((page - 1) * page_size, page_size).to_dicts(),
+        }
@@ -0,0 +1,64 @@
+import json
+import asyncio
+
+
+class SingleFlight:
+    """合并并发的相同请求
+
+    同一个键在计算完成之前到达的请求不再重复计算，而是等待正在进行的那一次并共享结果
+    （包括异常）。计算以独立任务运行并用 asyncio.shield 保护，单个客户端断开不会取消
+    其他等待者依赖的计算。计算完成后键即被移除，之后的请求会重新计算。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._in_flight = {}  # {键: asyncio.Task}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    @staticmethod
+    def make_key(*parts):
+        """由请求参数生成规范化的键（字典按键排序）"""
+        return json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+
+    async def do(self, key, func):
+        """
+        执行或加入一次计算
+
+        Args:
+            key: 请求键，建议由 make_key 生成
+            func: 无参数、返回可等待对象的函数，如 lambda: asyncio.to_thread(compute, ...)
+
+        Returns:
+            计算结果
+        """
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            self.failures += 1
+
+    def stats(self):
+        """合并统计：coalesced 为等待已有计算而未重复计算的请求数"""
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            "failures": self.failures,
+            "in_flight": len(self._in_flight),
+        }
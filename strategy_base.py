@@ -4,8 +4,12 @@ import pandas as pd
 import polars as pl
 from datetime import datetime
 import matplotlib.pyplot as plt
-from data_manager import DataManager
+from data_manager import DataManager, StreamingDataManager
 from get_top_bonds import get_top_bonds_by_score
+from filter_compiler import referenced_columns
+from feature_store import is_lookahead_feature
+from factor_expr import compile_factor, referenced_columns as factor_columns
+from rebalance_schedule import rebalance_flags
 from tiktrack import timed_stage
 
 # 设置中文显示
@@ -54,6 +58,10 @@ class DailySnapshot:
         self.total_value = total_value
 
 
+# 再平衡模式：full 每日按目标持仓全量调整；incremental 只交易进出TOPN的转债
+REBALANCE_MODES = ("full", "incremental")
+
+
 class BaseStrategy:
     """策略基类"""
     
@@ -72,11 +80,38 @@ class BaseStrategy:
         self.preprocessed_data = None
         self.top_bonds = None
         self.portfolio_state = None  # 添加portfolio_state属性
+        self.rebalance_mode = "full"
+        self.drift_tolerance = None  # 增量模式下留存持仓相对目标金额的偏离容忍带，如0.2表示±20%
+        self.rebalance_count = 0  # 回测区间内的调仓日数量
+        self.benchmark_name = None
+        self.benchmark_returns = None  # 与回测交易日对齐的基准日收益率
     
     @timed_stage("预处理所有数据")
-    def preprocess_data(self, data_manager: DataManager, config):
-        """预处理所有数据，提前计算得到每日TOPN的数据"""
-        self.top_bonds = get_top_bonds_by_score(df = data_manager.get_all_data(), config= config)
+    def preprocess_data(self, data_manager: DataManager, config, rebalance_dates=None):
+        """预处理所有数据，提前计算得到每日TOPN的数据
+        
+        配置了 strategy_params.universe 时，直接使用DataManager预先计算的选债范围掩码筛选数据；
+        传入 rebalance_dates 时只对调仓日计算排名
+        """
+        self.prepare_features(data_manager, config)
+        selection_frame = data_manager.get_selection_frame(config)
+        if rebalance_dates is not None:
+            selection_frame = selection_frame.filter(pl.col("trade_date").is_in(rebalance_dates))
+        self.top_bonds = get_top_bonds_by_score(df = selection_frame, config= config)
+    
+    @staticmethod
+    def prepare_features(data_manager: DataManager, config):
+        """确保配置的指标、过滤条件和派生因子中引用的时间序列特征（如 ret_20d）已计算"""
+        strategy_params = config.get('strategy_params', {})
+        indicators = strategy_params.get('indicators', [])
+        columns = indicators + referenced_columns(strategy_params.get('filters', {}))
+        for expression in strategy_params.get('derived_factors', {}).values():
+            columns.extend(factor_columns(expression))
+        
+        lookahead = [name for name in columns if is_lookahead_feature(name)]
+        if lookahead:
+            print(f"警告: {lookahead} 包含未来信息，回测结果不可信")
+        data_manager.ensure_features(columns)
     
     @timed_stage("获取每日关键数据")
     def _get_filtered_daily_data(self, data_manager: DataManager, current_date, top_bonds_today=None):
@@ -104,12 +139,24 @@ class BaseStrategy:
         
         return filtered_data
     
-    def run_backtest(self, data_manager: DataManager, config):
-        """运行回测"""
+    def run_backtest(self, data_manager: DataManager, config, top_bonds: pl.DataFrame = None, selection=None):
+        """运行回测
+        
+        Args:
+            data_manager: 数据管理器；传入StreamingDataManager时按日期窗口流式回测，内存占用以窗口为上限
+            config: 策略配置
+            top_bonds: 预先计算好的每日TOPN数据（如多策略对比时共享计算的结果），为None时自行预处理
+            selection: 多组权重选债结果中的一组（MultiWeightSelection.for_weights(k)），
+                按日期直接取行号，不需要逐日过滤TOPN数据
+        """
         start_time = time.time()
         
-        # 预处理数据
-        self.preprocess_data(data_manager, config=config)
+        self.rebalance_mode = config.get('rebalance_mode', 'full')
+        if self.rebalance_mode not in REBALANCE_MODES:
+            raise ValueError(f"无效的再平衡模式: {self.rebalance_mode}。有效选项: {list(REBALANCE_MODES)}")
+        self.drift_tolerance = config.get('drift_tolerance')
+        if self.drift_tolerance is not None and self.drift_tolerance < 0:
+            raise ValueError(f"drift_tolerance 不能为负数: {self.drift_tolerance}")
         
         # 获取日期范围内的交易日期
         start_date = config.get('start_date')
@@ -123,35 +170,38 @@ class BaseStrategy:
         # 预先分配空间以存储每日总资产值
         self.portfolio_values = np.zeros(len(dates))
         
-        for i, current_date in enumerate(dates):
-            # 获取当日TOP N债券
-            top_bonds_today = self.top_bonds.filter(pl.col("trade_date") == current_date)
-            
-            # 直接从data_manager获取当日价格字典，避免重复创建
-            prices_dict = data_manager.get_daily_prices(current_date)
-            
-            # 以收盘价更新当前持仓的市场价值
-            self._update_positions_market_value(prices_dict)
-
-            # 计算目标持仓
-            target_positions = self._calculate_target_positions(top_bonds_today, prices_dict)
-            
-            # 计算持仓差异并执行交易
-            self._execute_rebalance(target_positions, current_date, prices_dict)
-            
-            # 计算当前总资产并存储
-            total_market_value = sum(pos.market_value for pos in self.positions.values())
-            self.portfolio_values[i] = self.cash + total_market_value
+        # 调仓日：只在这些交易日计算排名和再平衡，其余交易日只按收盘价更新净值
+        rebalance_mask = rebalance_flags(dates, config.get('rebalance_schedule', 'daily'))
+        rebalance_dates = None if rebalance_mask.all() else [d for d, flag in zip(dates, rebalance_mask) if flag]
+        self.rebalance_count = int(rebalance_mask.sum())
+        
+        if isinstance(data_manager, StreamingDataManager):
+            self._run_streaming_backtest(data_manager, config, rebalance_dates)
+        else:
+            # 预处理数据
+            if selection is not None:
+                self.top_bonds = None
+            elif top_bonds is None:
+                self.preprocess_data(data_manager, config=config, rebalance_dates=rebalance_dates)
+            else:
+                self.top_bonds = top_bonds
             
-            # 记录每日持仓快照
-            self._save_daily_snapshot(current_date)
+            # 各调仓日的序号，两个调仓日之间的交易日持仓不变，整段一次性计算净值
+            rebalance_idx = np.append(np.flatnonzero(rebalance_mask), len(dates))
+            if rebalance_idx[0] > 0:
+                self._mark_to_market(0, rebalance_idx[0], dates, data_manager)
+            for i, next_i in zip(rebalance_idx[:-1], rebalance_idx[1:]):
+                current_date = dates[i]
+                # 获取当日TOP N债券
+                if selection is not None:
+                    top_bonds_today = selection.get_top_bonds(current_date)
+                else:
+                    top_bonds_today = self.top_bonds.filter(pl.col("trade_date") == current_date)
+                self._run_day(i, current_date, top_bonds_today, data_manager)
+                if next_i > i + 1:
+                    self._mark_to_market(i + 1, next_i, dates, data_manager)
             
-            # 更新最新的投资组合状态
-            self.portfolio_state = PortfolioState(
-                cash=self.cash,
-                positions=self.positions,
-                timestamp=current_date
-            )
+            self._attach_benchmark(data_manager, config, dates)
         
         end_time = time.time()
         self.execution_time = end_time - start_time
@@ -166,6 +216,131 @@ class BaseStrategy:
                 timestamp=final_date
             )
     
+    def _attach_benchmark(self, data_manager: DataManager, config, dates):
+        """取回测区间内的基准日收益率，基准由配置的 benchmark 指定（默认 "basic"，为空时不计算）"""
+        self.benchmark_name = config.get('benchmark', 'basic')
+        self.benchmark_returns = None
+        if not self.benchmark_name or not dates:
+            return
+        try:
+            daily_returns = data_manager.get_benchmark_returns(self.benchmark_name)
+            self.benchmark_returns = daily_returns[[data_manager.date_index[date] for date in dates]]
+        except Exception as e:
+            print(f"计算基准收益率失败，结果中不包含基准指标: {e}")
+    
+    def _run_streaming_backtest(self, data_manager: StreamingDataManager, config, rebalance_dates=None):
+        """按日期窗口流式回测
+        
+        每次只读取一个窗口的数据，在窗口内计算每日排名后逐日推进。
+        排名是按交易日截面计算的，得分相同时按代码决定先后，因此窗口切分不影响选债结果，
+        可用 compare_strategies.check_streaming_parity 对照内存回测。
+        传入 rebalance_dates 时只对调仓日排名和再平衡，其余交易日按价格字典更新净值。
+        """
+        # 流式模式不支持需要回看数据的时间序列特征，引用时直接报错
+        self.prepare_features(data_manager, config)
+        
+        # 流式模式下没有全量数据的掩码，将选债范围转换为过滤表达式作用于每个窗口
+        strategy_params = config.get('strategy_params', {})
+        universe = strategy_params.get('universe')
+        universe_expr = data_manager.universe_expression(universe) if universe else None
+        
+        # 派生因子的截面函数在选债范围内按交易日计算，先过滤范围再在窗口内求值（与内存回测一致）
+        derived_exprs = [
+            compile_factor(expression).alias(name)
+            for name, expression in strategy_params.get('derived_factors', {}).items()
+        ]
+        
+        rebalance_set = set(rebalance_dates) if rebalance_dates is not None else None
+        
+        i = 0
+        for window_dates, window_data in data_manager.iter_windows(config.get('start_date'), config.get('end_date')):
+            if universe_expr is not None:
+                window_data = window_data.filter(universe_expr)
+            if derived_exprs:
+                window_data = window_data.with_columns(derived_exprs)
+            
+            if rebalance_set is not None:
+                window_data = window_data.filter(pl.col("trade_date").is_in(rebalance_dates))
+            
+            # 只对当前窗口计算每日TOPN
+            self.top_bonds = get_top_bonds_by_score(df=window_data, config=config)
+            
+            for current_date in window_dates:
+                if rebalance_set is None or current_date in rebalance_set:
+                    top_bonds_today = self.top_bonds.filter(pl.col("trade_date") == current_date)
+                    self._run_day(i, current_date, top_bonds_today, data_manager)
+                else:
+                    self._hold_day(i, current_date, data_manager)
+                i += 1
+    
+    def _hold_day(self, i, current_date, data_manager: DataManager):
+        """非调仓日（流式模式）：持仓不变，只按当日价格字典更新市值和净值"""
+        self._update_positions_market_value(data_manager.get_daily_prices(current_date))
+        self.portfolio_values[i] = self.cash + sum(pos.market_value for pos in self.positions.values())
+        self._save_daily_snapshot(current_date)
+    
+    @timed_stage("非调仓日净值更新")
+    def _mark_to_market(self, start, end, dates, data_manager: DataManager):
+        """非调仓日 [start, end) 持仓不变，由价格矩阵一次性计算这些交易日的持仓市值和净值
+        
+        价格无效（缺失或为0）时沿用上一个有效价格，与 _update_positions_market_value 的规则一致
+        """
+        codes = list(self.positions)
+        if codes:
+            rows = [data_manager.date_index[date] for date in dates[start:end]]
+            cols = np.searchsorted(np.array(data_manager.codes), codes)
+            prices = np.asarray(data_manager.price_matrix)[np.ix_(rows, cols)]
+            quantities = np.array([self.positions[code].quantity for code in codes], dtype=float)
+            
+            # 以当前市值对应的价格作为首行，向下沿用最近的有效价格
+            last_prices = np.array([self.positions[code].market_value for code in codes]) / quantities
+            stacked = np.vstack([last_prices, np.where(prices > 0, prices, np.nan)])
+            last_valid = np.where(~np.isnan(stacked), np.arange(len(stacked))[:, None], 0)
+            np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+            market_values = stacked[last_valid, np.arange(len(codes))][1:] * quantities
+            
+            values = self.cash + market_values.sum(axis=1)
+            for code, market_value in zip(codes, market_values[-1]):
+                self.positions[code].market_value = market_value
+        else:
+            values = np.full(end - start, self.cash)
+        
+        self.portfolio_values[start:end] = values
+        for date, total_value in zip(dates[start:end], values):
+            self.daily_snapshots.append(DailySnapshot(date, self.cash, self.positions, total_value))
+    
+    def _run_day(self, i, current_date, top_bonds_today: pl.DataFrame, data_manager: DataManager):
+        """推进单个交易日：更新市值、再平衡、记录净值和快照"""
+        # 直接从data_manager获取当日价格字典，避免重复创建
+        prices_dict = data_manager.get_daily_prices(current_date)
+        
+        # 以收盘价更新当前持仓的市场价值
+        self._update_positions_market_value(prices_dict)
+
+        if self.rebalance_mode == "incremental":
+            # 只交易进出TOPN的转债
+            self._execute_incremental_rebalance(top_bonds_today, current_date, prices_dict)
+        else:
+            # 计算目标持仓
+            target_positions = self._calculate_target_positions(top_bonds_today, prices_dict)
+            
+            # 计算持仓差异并执行交易
+            self._execute_rebalance(target_positions, current_date, prices_dict)
+        
+        # 计算当前总资产并存储
+        total_market_value = sum(pos.market_value for pos in self.positions.values())
+        self.portfolio_values[i] = self.cash + total_market_value
+        
+        # 记录每日持仓快照
+        self._save_daily_snapshot(current_date)
+        
+        # 更新最新的投资组合状态
+        self.portfolio_state = PortfolioState(
+            cash=self.cash,
+            positions=self.positions,
+            timestamp=current_date
+        )
+    
     def _calculate_target_positions(self,top_bonds_today: pl.DataFrame, prices_dict: dict) -> dict:
         """计算目标持仓"""
         # 选择得分最高的N只转债
@@ -261,6 +436,55 @@ class BaseStrategy:
                     buy_quantity = target_quantity - current_quantity
                     self._execute_buy(code, buy_quantity, target['price'], target['name'], current_date)
 
+    @timed_stage("执行增量再平衡")
+    def _execute_incremental_rebalance(self, top_bonds_today: pl.DataFrame, current_date: datetime, prices_dict: dict):
+        """增量再平衡
+        
+        用集合运算比较当日TOPN与当前持仓：退出的全部卖出，新进入的按目标金额买入；
+        留存的持仓只在设置了 drift_tolerance 且市值偏离目标金额超过容忍带时调整到目标数量
+        """
+        codes = [str(code) for code in top_bonds_today['code'].to_list()]
+        names = dict(zip(codes, top_bonds_today['name'].to_list()))
+        target_codes = {code for code in codes if prices_dict.get(code, 0) > 0}
+        held_codes = set(self.positions)
+        
+        total_assets = self.cash + sum(pos.market_value for pos in self.positions.values())
+        amount_per_bond = total_assets / self.top_n
+        
+        # 退出TOPN的持仓全部卖出
+        for code in held_codes - target_codes:
+            price = prices_dict.get(code, 0)
+            if price > 0:
+                self._execute_sell(code, price, current_date)
+        
+        # 留存持仓偏离过大时调整，先卖后买
+        buys = []
+        if self.drift_tolerance is not None:
+            for code in held_codes & target_codes:
+                position = self.positions[code]
+                if abs(position.market_value / amount_per_bond - 1) <= self.drift_tolerance:
+                    continue
+                price = prices_dict[code]
+                target_quantity = int(amount_per_bond / price)
+                if position.quantity > target_quantity:
+                    self._execute_sell(code, price, current_date, position.quantity - target_quantity)
+                elif position.quantity < target_quantity:
+                    buys.append((code, target_quantity - position.quantity, price))
+        
+        # 新进入TOPN的转债按排名顺序买入
+        for code in codes:
+            if code in target_codes and code not in held_codes:
+                price = prices_dict[code]
+                quantity = int(amount_per_bond / price)
+                if quantity > 0:
+                    buys.append((code, quantity, price))
+        
+        # 卖出所得可能少于目标金额（如亏损退出），按剩余现金缩减买入数量，避免整笔买入被取消而留下空仓位
+        for code, quantity, price in buys:
+            quantity = min(quantity, int(self.cash / price))
+            if quantity > 0:
+                self._execute_buy(code, quantity, price, names[code], current_date)
+    
     @timed_stage("执行卖出操作")
     def _execute_sell(self, code: str, price: float, current_date: datetime, quantity=None):
         """执行卖出操作"""
@@ -419,7 +643,7 @@ class BaseStrategy:
         total_sell_trades = len([record for record in self.trade_records if record['操作'] == '卖出'])
         win_rate = win_trades / total_sell_trades if total_sell_trades > 0 else 0
         
-        return {
+        results = {
             "策略名称": self.strategy_name,
             "初始资金": self.initial_capital,
             "结束净值": self.portfolio_values[-1] if len(self.portfolio_values) > 0 else 0,
@@ -434,7 +658,40 @@ class BaseStrategy:
             "回测天数": days,
             "最大回撤起始日期": self.dates_array[max_drawdown_start] if max_drawdown_start is not None else None,
             "最大回撤结束日期": self.dates_array[max_drawdown_end] if max_drawdown_end is not None else None,
-            "执行耗时": self.execution_time
+            "执行耗时": self.execution_time,
+            "再平衡模式": self.rebalance_mode,
+            "调仓次数": self.rebalance_count
+        }
+        
+        if self.benchmark_returns is not None and len(self.benchmark_returns) == len(self.portfolio_values):
+            results.update(self._calculate_benchmark_metrics(daily_returns, annual_return, days))
+        return results
+    
+    def _calculate_benchmark_metrics(self, daily_returns, annual_return, days, trading_days=252):
+        """计算相对基准的超额收益率、跟踪误差、信息比率和贝塔"""
+        # 首日的基准收益发生在回测开始之前，与策略日收益率对齐时去掉
+        benchmark_returns = self.benchmark_returns[1:]
+        benchmark_total = np.prod(1 + benchmark_returns) - 1
+        benchmark_annual = (1 + benchmark_total) ** (trading_days / days) - 1
+        
+        active_returns = daily_returns - benchmark_returns
+        tracking_error = np.std(active_returns) * np.sqrt(trading_days) if len(active_returns) > 0 else 0
+        information_ratio = np.mean(active_returns) * trading_days / tracking_error if tracking_error > 0 else 0
+        
+        benchmark_var = np.var(benchmark_returns) if len(benchmark_returns) > 0 else 0
+        beta = (
+            np.mean((daily_returns - daily_returns.mean()) * (benchmark_returns - benchmark_returns.mean())) / benchmark_var
+            if benchmark_var > 0 else 0
+        )
+        
+        return {
+            "基准": self.benchmark_name,
+            "基准总收益率": benchmark_total,
+            "基准年化收益率": benchmark_annual,
+            "年化超额收益率": annual_return - benchmark_annual,
+            "跟踪误差": tracking_error,
+            "信息比率": information_ratio,
+            "贝塔": beta,
         }
     
     def plot_performance(self):
@@ -0,0 +1,165 @@
+import numpy as np
+import polars as pl
+from tiktrack import timed_stage
+
+
+# 交易记录（列式台账）中使用的列名，与 BaseStrategy.trade_records 一致
+DATE_COLUMN = '日期'
+CODE_COLUMN = '转债代码'
+SIDE_COLUMN = '操作'
+QUANTITY_COLUMN = '数量'
+PRICE_COLUMN = '价格'
+AMOUNT_COLUMN = '金额'
+BUY_SIDE = '买入'
+
+
+def _with_offsets(frame, keys, totals):
+    """为买入或卖出记录加上所在分组在全局累计数量轴上的起点，并按分组内的先后顺序排列"""
+    return (
+        frame.join(totals.select([*keys, 'offset', 'total']), on=keys, how='inner')
+        .sort([*keys, 'seq'])
+        .with_columns(pl.col(QUANTITY_COLUMN).cast(pl.Float64).cum_sum().over(keys).alias('cum_quantity'))
+    )
+
+
+@timed_stage("匹配交易回合")
+def match_round_trips(ledger: pl.DataFrame, keys=(CODE_COLUMN,)) -> pl.DataFrame:
+    """
+    按先进先出将买入和卖出匹配为交易回合（每一对买入批次与卖出记录的成交数量）
+
+    每个分组（默认按转债代码，批量回测时可加入策略名等列）的买入和卖出分别按先后顺序累计数量，
+    得到累计数量轴上首尾相接的区间；各分组依次排在同一条全局数量轴上。一笔买入与一笔卖出的
+    匹配数量即为两者区间的重叠长度。把所有区间端点合并排序后，每一小段恰好属于一笔买入和
+    至多一笔卖出，用二分查找即可一次性完成全部匹配，不需要逐笔循环。
+
+    Args:
+        ledger: 交易记录，至少包含 日期、转债代码、操作、数量、价格 列，行顺序为成交顺序
+        keys: 分组列
+
+    Returns:
+        pl.DataFrame: 每行一个回合，包含分组列、买入/卖出日期和价格、数量、盈亏、收益率、持有天数；
+            尚未卖出的部分卖出日期为空
+    """
+    keys = list(keys)
+    ledger = ledger.with_row_index('seq')
+    is_buy = pl.col(SIDE_COLUMN) == BUY_SIDE
+
+    totals = (
+        ledger.filter(is_buy)
+        .group_by(keys)
+        .agg(pl.col(QUANTITY_COLUMN).cast(pl.Float64).sum().alias('total'))
+        .sort(keys)
+        .with_columns((pl.col('total').cum_sum() - pl.col('total')).alias('offset'))
+    )
+    buys = _with_offsets(ledger.filter(is_buy), keys, totals)
+    # 卖出数量超过累计买入的部分没有可匹配的批次，截断到买入总量
+    sells = _with_offsets(ledger.filter(~is_buy), keys, totals).with_columns([
+        (pl.col('offset') + pl.min_horizontal(pl.col('cum_quantity'), pl.col('total'))).alias('end'),
+        (pl.col('offset') + pl.min_horizontal(
+            pl.col('cum_quantity') - pl.col(QUANTITY_COLUMN).cast(pl.Float64), pl.col('total')
+        )).alias('start'),
+    ])
+    buys = buys.with_columns([
+        (pl.col('offset') + pl.col('cum_quantity')).alias('end'),
+        (pl.col('offset') + pl.col('cum_quantity') - pl.col(QUANTITY_COLUMN).cast(pl.Float64)).alias('start'),
+    ])
+
+    buy_start, buy_end = buys.get_column('start').to_numpy(), buys.get_column('end').to_numpy()
+    sell_start, sell_end = sells.get_column('start').to_numpy(), sells.get_column('end').to_numpy()
+
+    # 全部区间端点切分出的小段，每段取中点定位所属的买入和卖出
+    breakpoints = np.unique(np.concatenate([buy_start, buy_end, sell_start, sell_end]))
+    lower, upper = breakpoints[:-1], breakpoints[1:]
+    middle = (lower + upper) / 2
+
+    buy_idx = np.searchsorted(buy_end, middle)
+    in_buy = buy_idx < len(buy_end)
+    in_buy[in_buy] &= buy_start[buy_idx[in_buy]] <= middle[in_buy]
+
+    sell_idx = np.searchsorted(sell_end, middle)
+    in_sell = sell_idx < len(sell_end)
+    in_sell[in_sell] &= sell_start[sell_idx[in_sell]] <= middle[in_sell]
+
+    segments = pl.DataFrame({
+        'buy_idx': buy_idx[in_buy],
+        'sell_idx': np.where(in_sell, sell_idx, -1)[in_buy],
+        'quantity': (upper - lower)[in_buy],
+    }).group_by(['buy_idx', 'sell_idx']).agg(pl.col('quantity').sum()).sort(['buy_idx', 'sell_idx'])
+
+    buy_side = buys.with_row_index('buy_idx').select([
+        pl.col('buy_idx').cast(pl.Int64),
+        *keys,
+        pl.col(DATE_COLUMN).alias('buy_date'),
+        pl.col(PRICE_COLUMN).cast(pl.Float64).alias('buy_price'),
+    ])
+    sell_side = sells.with_row_index('sell_idx').select([
+        pl.col('sell_idx').cast(pl.Int64),
+        pl.col(DATE_COLUMN).alias('sell_date'),
+        pl.col(PRICE_COLUMN).cast(pl.Float64).alias('sell_price'),
+    ])
+
+    # 未卖出的部分 sell_idx 为 -1，左连接后卖出日期和价格为空
+    return (
+        segments.with_columns([pl.col('buy_idx').cast(pl.Int64), pl.col('sell_idx').cast(pl.Int64)])
+        .join(buy_side, on='buy_idx', how='left')
+        .join(sell_side, on='sell_idx', how='left')
+        .sort(['buy_idx', 'sell_idx'])
+        .select([*keys, 'buy_date', 'buy_price', 'sell_date', 'sell_price', 'quantity'])
+        .with_columns([
+            ((pl.col('sell_price') - pl.col('buy_price')) * pl.col('quantity')).alias('pnl'),
+            (pl.col('sell_price') / pl.col('buy_price') - 1).alias('return'),
+            (pl.col('sell_date') - pl.col('buy_date')).dt.total_days().alias('holding_days'),
+        ])
+    )
+
+
+def analyze_trades(strategy, cost_rate=0.0005, trading_days=252):
+    """
+    交易分析：回合统计、换手率和交易成本拖累
+
+    回测引擎本身不计交易费用，成本拖累按单边费率 cost_rate 对成交金额估算
+
+    Args:
+        strategy: 已完成回测的策略对象
+        cost_rate: 估算用的单边交易费率
+        trading_days: 年交易日数
+
+    Returns:
+        dict: summary（汇总指标）和 round_trips（回合明细DataFrame）
+    """
+    ledger = pl.DataFrame(strategy.trade_records)
+    days = len(strategy.portfolio_values)
+    if ledger.is_empty() or days == 0:
+        return {"summary": {"round_trips": 0}, "round_trips": None}
+
+    trips = match_round_trips(ledger)
+    closed = trips.filter(pl.col('sell_date').is_not_null())
+
+    average_value = float(np.mean(strategy.portfolio_values))
+    traded_amount = float(ledger.get_column(AMOUNT_COLUMN).cast(pl.Float64).sum())
+    annualize = trading_days / days
+
+    summary = {"round_trips": closed.height}
+    if closed.height > 0:
+        stats = closed.select([
+            (pl.col('pnl') > 0).mean().alias('win_rate'),
+            ((pl.col('pnl') > 0).cast(pl.Float64) * pl.col('quantity')).sum().alias('win_quantity'),
+            pl.col('quantity').sum().alias('closed_quantity'),
+            pl.col('return').mean().alias('avg_return'),
+            pl.col('return').median().alias('median_return'),
+            pl.col('holding_days').mean().alias('avg_holding_days'),
+            pl.col('holding_days').median().alias('median_holding_days'),
+            pl.col('pnl').sum().alias('realized_pnl'),
+        ]).to_dicts()[0]
+        stats['quantity_win_rate'] = stats.pop('win_quantity') / stats.pop('closed_quantity')
+        summary.update(stats)
+
+    summary.update({
+        "open_quantity": float(trips.filter(pl.col('sell_date').is_null()).get_column('quantity').sum()),
+        "traded_amount": traded_amount,
+        # 单边换手：买卖成交金额之和的一半相对平均资产，年化
+        "annual_turnover": traded_amount / 2 / average_value * annualize if average_value > 0 else None,
+        "estimated_cost": traded_amount * cost_rate,
+        "annual_cost_drag": traded_amount * cost_rate / average_value * annualize if average_value > 0 else None,
+    })
+    return {"summary": summary, "round_trips": trips}
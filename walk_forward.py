@@ -0,0 +1,324 @@
+import copy
+import json
+import time
+import itertools
+import threading
+import numpy as np
+import polars as pl
+from concurrent.futures import ThreadPoolExecutor, Future
+from data_manager import DataManager
+from strategy_base import BaseStrategy
+from get_top_bonds import get_top_bonds_by_score, get_top_bonds_multi_weights, check_multi_weight_parity
+
+
+# 参数网格中的权重键：有多组候选权重时，其余参数相同的各组权重用一次矩阵运算同时选债
+WEIGHTS_KEY = "strategy_params.weights"
+
+
+def _set_param(config, dotted_key, value):
+    """按 "strategy_params.weights" 形式的键设置配置项"""
+    keys = dotted_key.split(".")
+    target = config
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = value
+
+
+def expand_param_grid(param_grid):
+    """将参数网格展开为参数组合列表
+
+    Args:
+        param_grid: {配置键: 候选值列表}，配置键支持 "strategy_params.weights" 形式
+
+    Returns:
+        list: [{配置键: 值}, ...]
+    """
+    if not param_grid:
+        return [{}]
+    keys = list(param_grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(param_grid[key] for key in keys))]
+
+
+class WalkForwardRunner:
+    """滚动样本内优化 + 样本外检验
+
+    按交易日将区间切分为连续的 (训练窗口, 测试窗口)，每个训练窗口内遍历参数网格选出最优参数，
+    再用该参数在紧随其后的测试窗口上回测，最后把各测试窗口的净值首尾相接成一条样本外净值曲线。
+
+    各窗口在线程池中并行执行，共享同一个已加载的DataManager。排名是按交易日截面计算的，
+    因此每组参数只需在整个区间上计算一次每日TOPN，各窗口按日期切片复用（记为缓存命中）。
+    参数网格包含多组权重时，其余参数相同的全部权重由 get_top_bonds_multi_weights 一次计算。
+    """
+
+    def __init__(self, data_manager: DataManager, base_config, param_grid,
+                 train_days=252, test_days=63, step_days=None,
+                 metric="夏普比率", max_workers=4, verify_selection=False):
+        """
+        Args:
+            data_manager: 已加载的数据管理器
+            base_config: 基础策略配置，start_date/end_date 为整个滚动区间
+            param_grid: 参数网格，{配置键: 候选值列表}
+            train_days: 训练窗口的交易日数
+            test_days: 测试窗口的交易日数
+            step_days: 窗口滚动步长，默认等于 test_days（测试窗口首尾相接）；不能小于 test_days，
+                否则测试窗口互相重叠，拼接后的净值会重复计算重叠的交易日
+            metric: 训练窗口内用于选择参数的指标（analyze_results中的键，越大越好）
+            max_workers: 并行窗口数
+            verify_selection: 多组权重选债时是否与 get_top_bonds_by_score 逐组对照，不一致时报错
+        """
+        self.data_manager = data_manager
+        self.base_config = base_config
+        self.param_sets = expand_param_grid(param_grid)
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days or test_days
+        if self.step_days < test_days:
+            raise ValueError(f"step_days ({self.step_days}) 不能小于 test_days ({test_days})，否则测试窗口互相重叠")
+        self.metric = metric
+        self.max_workers = max_workers
+        self.verify_selection = verify_selection
+        self.weight_vectors = [list(vector) for vector in param_grid.get(WEIGHTS_KEY, [])]
+        self.multi_weights = len(self.weight_vectors) > 1
+
+        self._ranking_cache = {}  # {参数键: Future[DataFrame 或 MultiWeightSelection]}
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _build_windows(self):
+        """切分训练/测试窗口"""
+        dates = self.data_manager.get_trading_dates_range(
+            self.base_config.get("start_date"), self.base_config.get("end_date")
+        )
+        windows = []
+        start = 0
+        while start + self.train_days < len(dates):
+            train = dates[start:start + self.train_days]
+            test = dates[start + self.train_days:start + self.train_days + self.test_days]
+            windows.append((train, test))
+            start += self.step_days
+        return windows
+
+    def _make_config(self, params, start_date, end_date):
+        """在基础配置上应用一组参数和日期区间"""
+        config = copy.deepcopy(self.base_config)
+        for key, value in params.items():
+            _set_param(config, key, value)
+        config["start_date"] = start_date.strftime("%Y-%m-%d")
+        config["end_date"] = end_date.strftime("%Y-%m-%d")
+        return config
+
+    def _compute_selection(self, params):
+        """在整个滚动区间上计算选债结果：多组权重时为 MultiWeightSelection，否则为每日TOPN DataFrame"""
+        full_config = copy.deepcopy(self.base_config)
+        for param_key, value in params.items():
+            _set_param(full_config, param_key, value)
+        BaseStrategy.prepare_features(self.data_manager, full_config)
+        selection_frame = self.data_manager.get_selection_frame(full_config)
+        if not self.multi_weights:
+            return get_top_bonds_by_score(selection_frame, full_config)
+
+        selection = get_top_bonds_multi_weights(selection_frame, full_config, self.weight_vectors)
+        if self.verify_selection:
+            mismatches = check_multi_weight_parity(selection_frame, full_config, selection)
+            if mismatches:
+                raise ValueError(f"多组权重选债结果与逐组计算不一致: { {k: len(v) for k, v in mismatches.items()} }")
+        return selection
+
+    def _get_top_bonds(self, params, start_date, end_date):
+        """获取一组参数在给定日期区间的选债结果
+
+        每组参数（多组权重时为除权重外的参数）在整个滚动区间上只计算一次，
+        并发请求同一组参数时只有一个线程计算，其余等待结果
+
+        Returns:
+            tuple: (传给 run_backtest 的选债参数, 是否命中缓存)
+        """
+        ranking_params = {k: v for k, v in params.items() if not (self.multi_weights and k == WEIGHTS_KEY)}
+        key = json.dumps(ranking_params, sort_keys=True, ensure_ascii=False, default=str)
+        with self._cache_lock:
+            future = self._ranking_cache.get(key)
+            hit = future is not None
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+                future = Future()
+                self._ranking_cache[key] = future
+
+        if not hit:
+            try:
+                future.set_result(self._compute_selection(ranking_params))
+            except Exception as e:
+                future.set_exception(e)
+
+        result = future.result()
+        if self.multi_weights:
+            # 回测按日期取行号，不需要切片
+            return {"selection": result.for_weights(self.weight_vectors.index(list(params[WEIGHTS_KEY])))}, hit
+        return {"top_bonds": result.filter(pl.col("trade_date").is_between(start_date, end_date))}, hit
+
+    def _run_backtest(self, params, dates):
+        """在给定交易日区间上运行一次回测"""
+        config = self._make_config(params, dates[0], dates[-1])
+        selection, hit = self._get_top_bonds(params, dates[0], dates[-1])
+        strategy = BaseStrategy(
+            config.get("name", "walk_forward"),
+            initial_capital=config.get("initial_capital", 1000000.0),
+            top_n=config.get("top_n", 10)
+        )
+        strategy.run_backtest(self.data_manager, config, **selection)
+        return strategy, hit
+
+    def _run_window(self, index, train_dates, test_dates):
+        """单个窗口：训练窗口遍历参数网格选优，测试窗口用最优参数回测"""
+        hits = 0
+        misses = 0
+
+        # 1. 样本内优化
+        train_start = time.time()
+        best_params = None
+        best_score = None
+        for params in self.param_sets:
+            strategy, hit = self._run_backtest(params, train_dates)
+            hits += hit
+            misses += not hit
+            score = strategy.analyze_results().get(self.metric)
+            if score is not None and (best_score is None or score > best_score):
+                best_score = score
+                best_params = params
+        train_time = time.time() - train_start
+        if best_params is None:
+            best_params = self.param_sets[0]
+
+        # 2. 样本外检验
+        test_start = time.time()
+        strategy, hit = self._run_backtest(best_params, test_dates)
+        hits += hit
+        misses += not hit
+        test_time = time.time() - test_start
+
+        test_results = strategy.analyze_results()
+        return {
+            "window": index,
+            "train_start": train_dates[0].strftime("%Y-%m-%d"),
+            "train_end": train_dates[-1].strftime("%Y-%m-%d"),
+            "test_start": test_dates[0].strftime("%Y-%m-%d"),
+            "test_end": test_dates[-1].strftime("%Y-%m-%d"),
+            "best_params": best_params,
+            "train_metric": best_score,
+            "test_return": test_results.get("总收益率"),
+            "test_max_drawdown": test_results.get("最大回撤"),
+            "test_sharpe": test_results.get("夏普比率"),
+            "train_time": train_time,
+            "test_time": test_time,
+            "cache_hits": hits,
+            "cache_misses": misses,
+            "_dates": list(strategy.dates_array),
+            "_nav": strategy.portfolio_values / strategy.initial_capital,
+            "_final_cash": strategy.cash,
+            "_final_positions": {
+                code: (position.quantity, position.market_value) for code, position in strategy.positions.items()
+            },
+        }
+
+    def _boundary_return(self, cash, positions, date):
+        """上一测试窗口的期末持仓从其最后一个交易日收盘持有到 date 收盘的收益率
+
+        价格无效（缺失或为0）时沿用期末市值对应的价格
+        """
+        prices = self.data_manager.get_daily_prices(date)
+        start_value = cash + sum(market_value for _, market_value in positions.values())
+        if start_value <= 0:
+            return 0.0
+        end_value = cash
+        for code, (quantity, market_value) in positions.items():
+            price = prices.get(code, 0)
+            end_value += quantity * price if price > 0 else market_value
+        return end_value / start_value - 1
+
+    def run(self):
+        """运行滚动优化
+
+        Returns:
+            dict: 各窗口的最优参数与耗时/缓存统计、拼接后的样本外净值曲线及其绩效指标
+        """
+        start_time = time.time()
+        windows = self._build_windows()
+        if not windows:
+            raise ValueError("区间内交易日不足以构成一个训练+测试窗口")
+        print(f"滚动优化: {len(windows)} 个窗口, 每个窗口 {len(self.param_sets)} 组参数")
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = [
+                executor.submit(self._run_window, i, train, test)
+                for i, (train, test) in enumerate(windows)
+            ]
+            window_results = [future.result() for future in futures]
+
+        # 拼接样本外净值：每个测试窗口首日按收盘价建仓，当日净值为1，
+        # 因此先用上一窗口的期末持仓计算到本窗口首日收盘的收益，再接上本窗口的净值
+        stitched_dates = []
+        stitched_nav = []
+        level = 1.0
+        previous = None
+        for result in window_results:
+            nav = result.pop("_nav")
+            dates = result.pop("_dates")
+            final_state = (result.pop("_final_cash"), result.pop("_final_positions"))
+            if len(nav) == 0:
+                continue
+            if previous is not None:
+                level *= 1 + self._boundary_return(*previous, dates[0])
+            stitched_dates.extend(dates)
+            stitched_nav.extend((level * nav).tolist())
+            level = stitched_nav[-1]
+            previous = final_state
+
+        # 复用策略的绩效计算
+        initial_capital = self.base_config.get("initial_capital", 1000000.0)
+        summary_strategy = BaseStrategy("walk_forward_oos", initial_capital=initial_capital)
+        summary_strategy.dates_array = np.array(stitched_dates)
+        summary_strategy.portfolio_values = np.array(stitched_nav) * initial_capital
+        summary = summary_strategy.analyze_results()
+        for key in ("交易次数", "胜率", "执行耗时"):
+            summary.pop(key, None)
+
+        return {
+            "windows": window_results,
+            "dates": [d.strftime("%Y-%m-%d") for d in stitched_dates],
+            "nav": stitched_nav,
+            "summary": summary,
+            "cache": {"hits": self.cache_hits, "misses": self.cache_misses},
+            "execution_time": time.time() - start_time,
+        }
+
+
+# 示例用法
+if __name__ == "__main__":
+    from create_strategy import get_default_config
+
+    base_config = get_default_config()
+    base_config["start_date"] = "2020-01-01"
+    base_config["end_date"] = "2024-12-31"
+
+    data_manager = DataManager(base_config["data_path"])
+    runner = WalkForwardRunner(
+        data_manager,
+        base_config,
+        param_grid={
+            "top_n": [5, 10, 20],
+            "strategy_params.weights": [[-1.0, -1.0], [-1.0, -0.5], [-0.5, -1.0]],
+        },
+        train_days=252,
+        test_days=63,
+        verify_selection=True,
+    )
+    result = runner.run()
+
+    for window in result["windows"]:
+        print(f"[{window['test_start']} ~ {window['test_end']}] 最优参数: {window['best_params']}, "
+              f"样本外收益: {window['test_return']:.2%}, 训练耗时: {window['train_time']:.2f}秒, "
+              f"缓存命中/未命中: {window['cache_hits']}/{window['cache_misses']}")
+    print(f"样本外年化收益率: {result['summary']['年化收益率']:.2%}, 夏普比率: {result['summary']['夏普比率']:.2f}")
+    print(f"排名缓存命中: {result['cache']['hits']}, 未命中: {result['cache']['misses']}, 总耗时: {result['execution_time']:.2f}秒")